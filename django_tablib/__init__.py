@@ -1,7 +1,9 @@
 from __future__ import absolute_import
 
 from .admin import TablibAdmin
+from .databooks import ModelDatabook
 from .fields import Field
 from .models import ModelDataset, NoObjectsException
 
-__all__ = [Field, ModelDataset, NoObjectsException, TablibAdmin]
+__all__ = [Field, ModelDatabook, ModelDataset, NoObjectsException,
+           TablibAdmin]
@@ -2,15 +2,23 @@
 from __future__ import unicode_literals
 
 import datetime
+from functools import partial
+
 import django
 from distutils.version import LooseVersion
 from django.contrib import admin
-from django.core.urlresolvers import reverse
-from django.http import Http404
+from django.http import (FileResponse, Http404, HttpResponseRedirect,
+                         JsonResponse)
+from django.template.response import TemplateResponse
 
 
-from django_tablib.base import mimetype_map
-from django_tablib.views import export
+from django_tablib import jobs
+from django_tablib.compat import reverse, ugettext as _, url
+from django_tablib.base import get_content_type, mimetype_map
+from django_tablib.databooks import DATABOOK_FORMATS
+from django_tablib.datasets import SimpleDataset
+from django_tablib.stats import ExportStats
+from django_tablib.views import export, export_databook
 
 from . import actions as django_tablib_actions
 
@@ -25,6 +33,17 @@ INVALID_EXPORT_FORMAT_ERROR_MSG = (
     "please choose from the following options: {1}")
 
 
+class ExportChangeListMixin(object):
+    """
+    Mixed into the admin's ChangeList class when building export querysets:
+    the queryset gets the list filters, search and ordering of the change
+    list, without the counts and pagination queries the change list page
+    runs for display.
+    """
+    def get_results(self, request):
+        pass
+
+
 class TablibAdmin(admin.ModelAdmin):
     change_list_template = 'tablib/change_list.html'
     formats = []
@@ -34,6 +53,24 @@ class TablibAdmin(admin.ModelAdmin):
     # only selected items.
     enable_admin_actions = True
     export_encoding = 'utf-8'
+    # stream exports to the client row by row for formats that support it
+    # (see django_tablib.streaming.streaming_formats) instead of building the
+    # whole file in memory first.
+    export_stream = False
+    # fetch this many objects from the database at a time while exporting
+    export_chunk_size = None
+    # build exports in the background (see django_tablib.jobs) and send the
+    # user to a page tracking the job's progress instead of making them wait
+    # for the file.
+    export_async = False
+    # compress exports as they are sent, 'gzip' or 'zip' (see
+    # django_tablib.compression). Background exports aren't compressed.
+    export_compression = None
+    # add a sheet with the objects of each inline (related to the exported
+    # objects) to exports in the formats of workbooks (see
+    # django_tablib.databooks), headers of the sheets can be set with a
+    # headers attribute on the inlines.
+    export_inlines = False
 
     def __init__(self, *args, **kwargs):
         for export_format in self.formats:
@@ -54,8 +91,6 @@ class TablibAdmin(admin.ModelAdmin):
         return info
 
     def get_urls(self):
-        from django.conf.urls import url
-
         def wrap(view):
             def wrapper(*args, **kwargs):
                 return self.admin_site.admin_view(view)(*args, **kwargs)
@@ -65,6 +100,13 @@ class TablibAdmin(admin.ModelAdmin):
             url(r'^tablib-export/(?P<export_format>\w+)/$',
                 wrap(self.tablib_export),
                 name='{0}_{1}_tablib_export'.format(*self.get_info())),
+            url(r'^tablib-export/jobs/(?P<job_id>[0-9a-f]{32})/$',
+                wrap(self.tablib_export_job),
+                name='{0}_{1}_tablib_export_job'.format(*self.get_info())),
+            url(r'^tablib-export/jobs/(?P<job_id>[0-9a-f]{32})/download/$',
+                wrap(self.tablib_export_download),
+                name='{0}_{1}_tablib_export_download'.format(
+                    *self.get_info())),
         ]
         urlpatterns += super(TablibAdmin, self).get_urls()
         return urlpatterns
@@ -72,16 +114,102 @@ class TablibAdmin(admin.ModelAdmin):
     def tablib_export(self, request, export_format):
         if export_format not in self.formats:
             raise Http404
-        queryset = self.get_tablib_queryset(request)
+        stats = ExportStats(self.model, export_format)
+        with stats.phase('queryset'):
+            queryset = self.get_tablib_queryset(request)
         filename = datetime.datetime.now().strftime(self.export_filename)
+        if self.export_async:
+            stats.cancel()
+            job_id = jobs.start_export_job(
+                queryset, headers=self.headers, file_type=export_format,
+                filename=filename, encoding=self.export_encoding,
+                chunk_size=self.export_chunk_size)
+            return HttpResponseRedirect(reverse(
+                'admin:{0}_{1}_tablib_export_job'.format(*self.get_info()),
+                kwargs={'job_id': job_id}))
+        if self.export_inlines and export_format in DATABOOK_FORMATS:
+            stats.cancel()
+            return export_databook(
+                request, self.get_export_sheets(request, queryset),
+                file_type=export_format, filename=filename,
+                encoding=self.export_encoding,
+                compression=self.export_compression)
         return export(request, queryset=queryset, model=self.model,
                       headers=self.headers, file_type=export_format,
-                      filename=filename, encoding=self.export_encoding)
+                      filename=filename, encoding=self.export_encoding,
+                      stream=self.export_stream,
+                      chunk_size=self.export_chunk_size, stats=stats,
+                      compression=self.export_compression)
+
+    def get_export_sheets(self, request, queryset):
+        """
+        Return the sheets of a multi-sheet export of ``queryset``, as
+        callables building their dataset (see
+        ``django_tablib.databooks.ModelDatabook``): the objects themselves,
+        then the objects of each inline related to them. Inlines without a
+        foreign key to the model (such as generic inlines) are left out.
+        """
+        sheets = [partial(SimpleDataset, queryset, headers=self.headers,
+                          chunk_size=self.export_chunk_size)]
+        for inline in self.get_inline_instances(request):
+            # generic inline formsets have no foreign key
+            fk = getattr(inline.get_formset(request), 'fk', None)
+            if fk is None:
+                continue
+            related = inline.get_queryset(request).filter(
+                **{'{0}__in'.format(fk.name): queryset.values('pk')})
+            sheets.append(partial(SimpleDataset, related,
+                                  headers=getattr(inline, 'headers', None),
+                                  chunk_size=self.export_chunk_size))
+        return sheets
+
+    def get_tablib_export_job(self, job_id):
+        status = jobs.get_job_status(job_id)
+        if status is None or status['model'] != '{0}.{1}'.format(
+                *self.get_info()):
+            raise Http404
+        return status
+
+    def tablib_export_job(self, request, job_id):
+        """
+        Show the progress of a background export, or return its status as
+        JSON when called with ``?status``.
+        """
+        job = self.get_tablib_export_job(job_id)
+        if 'status' in request.GET:
+            return JsonResponse(job)
+
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title=_('Export to %s') % job['file_type'].upper(),
+            job=job,
+            status_url='{0}?status'.format(request.path),
+            download_url=reverse(
+                'admin:{0}_{1}_tablib_export_download'.format(
+                    *self.get_info()),
+                kwargs={'job_id': job_id}),
+        )
+        return TemplateResponse(request, 'tablib/export_job.html', context)
+
+    def tablib_export_download(self, request, job_id):
+        job = self.get_tablib_export_job(job_id)
+        if job['status'] != jobs.DONE:
+            raise Http404
+        response = FileResponse(
+            jobs.get_export_storage().open(job['file']),
+            content_type=get_content_type(job['file_type'],
+                                          encoding=job['encoding']))
+        response['Content-Disposition'] = 'attachment; filename="{0}"'.format(
+            job['filename'])
+        return response
 
     def get_tablib_queryset(self, request):
         # allow other admin clases to override change list view,
         # taken from django ModelAdmin
         ChangeList = self.get_changelist(request)
+        ChangeList = type(str('Export{0}'.format(ChangeList.__name__)),
+                          (ExportChangeListMixin, ChangeList), {})
 
         list_display = self.get_list_display(request)
         list_display_links = self.get_list_display_links(request, list_display)
@@ -90,7 +218,7 @@ class TablibAdmin(admin.ModelAdmin):
                          if hasattr(self, 'get_search_fields')
                          else self.search_fields)
 
-        cl = ChangeList(
+        args = [
             request,
             self.model,
             list_display,
@@ -103,8 +231,13 @@ class TablibAdmin(admin.ModelAdmin):
             self.list_max_show_all,
             self.list_editable,
             self,
-        )
-        return cl.get_queryset(request)
+        ]
+        if django.VERSION >= (2, 1):
+            args.append(self.get_sortable_by(request))
+        if django.VERSION >= (4, 0):
+            args.append(self.search_help_text)
+        cl = ChangeList(*args)
+        return cl.queryset
 
     def changelist_view(self, request, extra_context=None):
         context = {'request': request}
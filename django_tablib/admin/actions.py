@@ -1,36 +1,32 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django import get_version
-from django.http import HttpResponse
 from django.utils.encoding import smart_str
-from django.utils.translation import ugettext_lazy as _
 
-from django_tablib.datasets import SimpleDataset
-from django_tablib.base import get_content_type
+from django_tablib.compat import ugettext_lazy as _
+from django_tablib.views import export
 
 
 def tablib_export_action(modeladmin, request, queryset, file_type="xls"):
     """
     Allow the user to download the current filtered list of items
 
+    The export is built like the ones of ``TablibAdmin``, with its
+    ``headers``, ``export_encoding``, ``export_stream``,
+    ``export_chunk_size`` and ``export_compression`` settings.
+
     :param file_type:
         One of the formats supported by tablib (e.g. "xls", "csv", "html",
         etc.)
     """
-
-    dataset = SimpleDataset(queryset, headers=None)
-    filename = '{0}.{1}'.format(
-        smart_str(modeladmin.model._meta.verbose_name_plural), file_type)
-
-    response_kwargs = {
-        'content_type': get_content_type(file_type)
-    }
-
-    response = HttpResponse(getattr(dataset, file_type), **response_kwargs)
-    response['Content-Disposition'] = 'attachment; filename={0}'.format(
-        filename)
-    return response
+    return export(
+        request, queryset=queryset, model=modeladmin.model,
+        headers=getattr(modeladmin, 'headers', None), file_type=file_type,
+        filename=smart_str(modeladmin.model._meta.verbose_name_plural),
+        encoding=getattr(modeladmin, 'export_encoding', 'utf-8'),
+        stream=getattr(modeladmin, 'export_stream', False),
+        chunk_size=getattr(modeladmin, 'export_chunk_size', None),
+        compression=getattr(modeladmin, 'export_compression', None))
 
 
 def xls_export_action(*args, **kwargs):
@@ -39,6 +35,12 @@ xls_export_action.__doc__ = tablib_export_action.__doc__
 xls_export_action.short_description = _("Export to Excel")
 
 
+def xlsx_export_action(*args, **kwargs):
+    return tablib_export_action(file_type="xlsx", *args, **kwargs)
+xlsx_export_action.__doc__ = tablib_export_action.__doc__
+xlsx_export_action.short_description = _("Export to Excel (xlsx)")
+
+
 def csv_export_action(*args, **kwargs):
     return tablib_export_action(file_type="csv", *args, **kwargs)
 csv_export_action.__doc__ = tablib_export_action.__doc__
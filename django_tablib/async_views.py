@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Async export views, for projects served over ASGI.
+
+CSV exports are sent by a ``StreamingHttpResponse`` iterating an async
+generator, which fetches rows ``chunk_size`` at a time in a thread (see
+``aiter_rows``), so a long download doesn't hold on to a worker thread while
+it waits for the client. Exports that can't be
+streamed that way (other formats, conditional or compressed exports...) are
+built by the views of ``django_tablib.views`` in a thread.
+
+Requires Python 3 and Django 4.2 or later, this module isn't imported by
+``django_tablib`` itself::
+
+    from django_tablib import async_views
+
+    urlpatterns = [
+        path('export/<model_name>/', async_views.generic_export),
+    ]
+"""
+import csv
+import datetime
+from itertools import islice
+
+import django
+from django.core.exceptions import ImproperlyConfigured
+
+if django.VERSION < (4, 2):
+    raise ImproperlyConfigured(
+        "django_tablib.async_views requires Django 4.2 or later")
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+
+from . import views
+from .admin import TablibAdmin
+from .base import get_content_type
+from .conditional import (get_validators, is_not_modified, not_modified,
+                          set_validators)
+from .datasets import SimpleDataset
+from .incremental import WATERMARK_HEADER
+from .query import SERVER_SIDE_FETCH_SIZE
+from .streaming import Echo
+
+
+async def aiter_rows(dataset, raw=False):
+    """
+    Async counterpart of ``dataset.iter_rows()`` (``iter_values()`` when
+    ``raw`` is true).
+
+    Like ``QuerySet.aiterator()``, the rows are produced by the sync
+    iterator in a thread, ``dataset.chunk_size`` rows at a time, so that
+    the event loop is free between chunks. Unlike it, this works with the
+    ``values_list()`` querysets of the fast path on Django 4.2, and keeps the
+    keyset pagination of ``django_tablib.query``.
+    """
+    rows = dataset.iter_values() if raw else dataset.iter_rows()
+    chunk_size = dataset.chunk_size or SERVER_SIDE_FETCH_SIZE
+    # thread sensitive: every chunk is read in the same thread, which owns
+    # the database connection and cursor of the iterator
+    next_chunk = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while True:
+        chunk = await next_chunk()
+        for row in chunk:
+            yield row
+        if len(chunk) < chunk_size:
+            return
+
+
+async def astream_csv(dataset, encoding='utf-8'):
+    """
+    Async counterpart of ``django_tablib.streaming.stream_csv``.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(dataset.headers).encode(encoding)
+    async for row in aiter_rows(dataset):
+        yield writer.writerow(row).encode(encoding)
+
+
+def stream_export(queryset, headers=None, filename='export',
+                  encoding='utf-8', chunk_size=None):
+    """
+    Return a response streaming ``queryset`` as CSV from an async generator.
+    Nothing is fetched until the response is sent, so sync views (such as
+    the admin's) can return it too.
+    """
+    dataset = SimpleDataset(queryset, headers=headers, lazy=True,
+                            chunk_size=chunk_size)
+    response = StreamingHttpResponse(
+        astream_csv(dataset, encoding=encoding),
+        content_type=get_content_type('csv', encoding=encoding))
+    response['Content-Disposition'] = 'attachment; filename="{0}.csv"'.format(
+        filename)
+    return response
+
+
+async def export(request, queryset=None, model=None, headers=None,
+                 file_type='xls', filename='export', encoding='utf-8',
+                 stream=True, chunk_size=None, version_field=None, **kwargs):
+    """
+    Async variant of ``django_tablib.views.export``.
+
+    CSV exports are streamed from an async generator, see ``stream_export``.
+    Other formats, or exports given any of the other arguments of
+    ``views.export`` (``compression``, ``server_side_cursor``...), are built
+    by ``views.export`` in a thread.
+    """
+    if queryset is None:
+        queryset = model.objects.all()
+    if file_type != 'csv' or not stream or any(kwargs.values()):
+        return await sync_to_async(views.export)(
+            request, queryset=queryset, model=model, headers=headers,
+            file_type=file_type, filename=filename, encoding=encoding,
+            stream=stream, chunk_size=chunk_size,
+            version_field=version_field, **kwargs)
+
+    etag = last_modified = None
+    if version_field:
+        etag, last_modified = await sync_to_async(get_validators)(
+            queryset, version_field, headers=headers, file_type=file_type,
+            encoding=encoding)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified(etag, last_modified)
+    response = stream_export(queryset, headers=headers, filename=filename,
+                             encoding=encoding, chunk_size=chunk_size)
+    return set_validators(response, etag, last_modified)
+
+
+async def generic_export(request, model_name=None):
+    """
+    Async variant of ``django_tablib.views.generic_export``, configured the
+    same way. CSV exports are always streamed.
+    """
+    prepared = await sync_to_async(views.prepare_generic_export)(
+        request, model_name)
+    if not isinstance(prepared, dict):
+        # a bad request
+        return prepared
+    watermark = prepared.pop('watermark')
+    # the point of this view: CSV is streamed whatever the STREAM option
+    prepared['stream'] = True
+    response = await export(request, **prepared)
+    if watermark is not None:
+        response[WATERMARK_HEADER] = watermark
+    return response
+
+
+class AsyncTablibAdmin(TablibAdmin):
+    """
+    ``TablibAdmin`` whose CSV exports are streamed from the async ORM, see
+    ``stream_export``. The queryset is still built by the (sync) admin view.
+    """
+    def tablib_export(self, request, export_format):
+        if (export_format != 'csv' or export_format not in self.formats or
+                self.export_async or self.export_compression):
+            return super(AsyncTablibAdmin, self).tablib_export(
+                request, export_format)
+        return stream_export(
+            self.get_tablib_queryset(request), headers=self.headers,
+            filename=datetime.datetime.now().strftime(self.export_filename),
+            encoding=self.export_encoding,
+            chunk_size=self.export_chunk_size)
@@ -2,19 +2,39 @@
 from __future__ import unicode_literals
 
 import datetime
+import decimal
+import six
 import tablib
+from functools import partial
+from operator import attrgetter, itemgetter, methodcaller
 
+from django.db import models
 from django.template.defaultfilters import date
-from django.utils.encoding import force_text
-from django.utils.translation import ugettext_lazy as _
+from django.utils import dateformat
+from django.utils.formats import get_format
+
+from . import columnar
+from .compat import BOOLEAN_FIELDS, force_text, ugettext_lazy as _
+from .query import (apply_only, apply_related_lookups, can_use_values_list,
+                    get_column_fields, is_path, iterate_queryset,
+                    iterate_values)
 
 mimetype_map = {
     'xls': 'application/vnd.ms-excel',
+    'xlsx': ('application/vnd.openxmlformats-officedocument.'
+             'spreadsheetml.sheet'),
     'csv': 'text/csv',
     'html': 'text/html',
     'yaml': 'text/yaml',
     'json': 'application/json',
 }
+if columnar.pyarrow is not None:
+    # the formats of django_tablib.columnar, only offered when they can be
+    # exported
+    mimetype_map.update({
+        'parquet': 'application/vnd.apache.parquet',
+        'arrow': 'application/vnd.apache.arrow.file',
+    })
 
 
 def get_content_type(export_format, encoding='utf-8'):
@@ -26,12 +46,300 @@ def get_content_type(export_format, encoding='utf-8'):
         encoding)
 
 
+# Fields whose values only need to be turned into text, see _clean_text.
+TEXT_FIELDS = (models.AutoField, models.CharField, models.TextField,
+               models.IntegerField, models.DecimalField, models.FloatField,
+               models.ForeignKey)
+
+
+def _clean_text(value):
+    if value is None:
+        return ''
+    value = force_text(value)
+    return '' if value == 'None' else value
+
+
+def _date_cleaner():
+    # Same as the date template filter, looking the format up only once.
+    date_format = get_format('SHORT_DATE_FORMAT')
+
+    def clean(value):
+        if value is None:
+            return ''
+        return force_text(dateformat.format(value, date_format))
+    return clean
+
+
+def _bool_cleaner():
+    yes, no = force_text(_("Y")), force_text(_("N"))
+
+    def clean(value):
+        if value is None:
+            return ''
+        return yes if value else no
+    return clean
+
+
+def _raw_value(value):
+    # attributes may be methods, which _cleanval calls as well
+    return value() if callable(value) else value
+
+
+def _raw_text(value):
+    # choice labels may be lazy translations
+    return None if value is None else force_text(value)
+
+
+# Formats whose serialisers handle native Python values, see
+# BaseDataset.export.
+NATIVE_FORMATS = ('json', 'yaml')
+
+
+def get_formatter(format):
+    """
+    Return a function formatting the raw values of a dataset for ``format``.
+
+    Values exported to text formats are formatted like ``_cleanval`` does,
+    with the translations of Y/N and the date format resolved once.
+    """
+    if format == 'yaml':
+        # yaml.safe_dump can't represent decimals; tablib's JSON export turns
+        # them into strings as well
+        def format_value(value):
+            if isinstance(value, decimal.Decimal):
+                return force_text(value)
+            return value
+        return format_value
+    elif format in NATIVE_FORMATS:
+        return None
+
+    clean_bool, clean_date = _bool_cleaner(), _date_cleaner()
+
+    def format_value(value):
+        if isinstance(value, bool):
+            return clean_bool(value)
+        elif isinstance(value, (datetime.date, datetime.datetime)):
+            return clean_date(value)
+        return _clean_text(value)
+    return format_value
+
+
+def _choices_getter(field, getter):
+    # Same as get_FOO_display(), without rebuilding the choices dict for
+    # every call.
+    choices = dict(field.flatchoices)
+
+    def get(row):
+        value = getter(row)
+        return choices.get(value, value)
+    return get
+
+
+def get_path_value(obj, path):
+    """
+    Follow a ``__`` separated attribute path such as ``customer__name`` from
+    ``obj``. The values reached through multi-valued relations (reverse
+    foreign keys, many-to-many) are joined with commas.
+    """
+    parts = path.split('__')
+    for i, part in enumerate(parts):
+        if obj is None:
+            return None
+        if i == len(parts) - 1 and hasattr(
+                obj, 'get_{0}_display'.format(part)):
+            return getattr(obj, 'get_{0}_display'.format(part))()
+        obj = getattr(obj, part)
+        if isinstance(obj, models.Manager):
+            rest = '__'.join(parts[i + 1:])
+            values = (get_path_value(related, rest) if rest else related
+                      for related in obj.all())
+            return ', '.join(force_text(value) for value in values
+                             if value is not None)
+    return obj
+
+
+def _has_choices(attr, field):
+    return (field is not None and bool(field.choices) and
+            attr == field.name and not field.is_relation)
+
+
+def _format_getter(format):
+    def export(self, **kwargs):
+        return self.export(format, **kwargs)
+    return export
+
+
 class BaseDataset(tablib.Dataset):
+    # number of model instances fetched from the database at a time, see
+    # django_tablib.query.iterate_queryset. None fetches the whole queryset
+    # with a single query.
+    chunk_size = None
+    # hold the values of model fields as they are rather than cleaned into
+    # text, see iter_values() and export()
+    raw = False
+    # read rows through a server side cursor on PostgreSQL, chunk_size rows
+    # per round trip, see django_tablib.query.iterate_server_side
+    server_side_cursor = False
+    # django_tablib.stats.ExportStats recording the fetch and rows phases
+    stats = None
+    # clean the rows of the values_list() fast path a batch of columns at a
+    # time, see django_tablib.columnwise
+    columnwise = False
 
-    def __init__(self):
-        data = map(self._getattrs, self.queryset)
+    def __init__(self, lazy=False, raw=None):
+        if raw is not None:
+            self.raw = raw
+        # A lazy dataset only carries its headers; rows are produced on
+        # demand by iter_rows() so that they can be streamed to the client.
+        if lazy:
+            data = []
+        elif self.raw:
+            data = self.iter_values()
+        else:
+            data = self.iter_rows()
         super(BaseDataset, self).__init__(headers=self.header_list, *data)
 
+    @classmethod
+    def _register_formats(cls):
+        # tablib's format properties (dataset.csv...) call the serialisers
+        # directly, they go through export() instead so that the values of
+        # raw datasets are formatted.
+        super(BaseDataset, cls)._register_formats()
+        for format, (export_set, import_set) in list(cls._formats.items()):
+            if export_set is not None:
+                getter = _format_getter(format)
+                setattr(cls, format, property(getter, import_set))
+                setattr(cls, 'get_{0}'.format(format), getter)
+
+    def export(self, format, **kwargs):
+        """
+        Export the dataset to ``format``, which is what the format properties
+        (``dataset.csv``...) do as well.
+
+        The values of raw datasets are formatted for ``format`` first: JSON
+        and YAML get native types, other formats the same text as cleaned
+        datasets.
+        """
+        formatter = get_formatter(format) if self.raw else None
+        if formatter is None:
+            return super(BaseDataset, self).export(format, **kwargs)
+        data = tablib.Dataset(headers=self.headers, title=self.title)
+        for row in self:
+            data.append([formatter(value) for value in row])
+        return data.export(format, **kwargs)
+
+    def iter_rows(self):
+        """
+        Yield the cleaned rows of the queryset one at a time without filling
+        the queryset's result cache.
+        """
+        return self._timed(self._iter_rows(), 'rows')
+
+    def iter_values(self):
+        """
+        Like ``iter_rows()``, but the values of model fields are left as they
+        are rather than cleaned into text: numbers stay numbers, dates stay
+        dates and booleans stay booleans. Used by the binary formats of
+        ``django_tablib.columnar``.
+        """
+        return self._timed(self._iter_rows(raw=True), 'rows')
+
+    def _timed(self, iterable, phase):
+        if self.stats is None:
+            return iterable
+        return self.stats.timed(iterable, phase)
+
+    def _iter_rows(self, raw=False):
+        queryset = apply_related_lookups(self.queryset, self.attr_list)
+        if self._is_customised('_getattrs'):
+            # a custom _getattrs() only returns cleaned values, raw or not
+            objects = iterate_queryset(queryset, self.chunk_size,
+                                       server_side=self.server_side_cursor)
+            for obj in self._timed(objects, 'fetch'):
+                yield self._getattrs(obj)
+            return
+
+        if can_use_values_list(self.queryset, self.attr_list):
+            rows = iterate_values(self.queryset, self.attr_list,
+                                  self.chunk_size,
+                                  server_side=self.server_side_cursor)
+            if self.columnwise and not raw:
+                # imported here, django_tablib.columnwise builds on this module
+                from .columnwise import iter_rows
+                for row in iter_rows(self, self._timed(rows, 'fetch')):
+                    yield row
+                return
+            getters = [itemgetter(i) for i in range(len(self.attr_list))]
+        else:
+            queryset = apply_only(queryset, self.attr_list)
+            rows = iterate_queryset(queryset, self.chunk_size,
+                                    server_side=self.server_side_cursor)
+            getters = None
+
+        columns = self._compile_columns(getters, raw=raw)
+        for row in self._timed(rows, 'fetch'):
+            yield [clean(get(row)) for get, clean in columns]
+
+    def _is_customised(self, name):
+        method = six.get_unbound_function(getattr(type(self), name))
+        return method is not six.get_unbound_function(
+            getattr(BaseDataset, name))
+
+    def _compile_columns(self, getters=None, raw=False):
+        """
+        Compile ``attr_list`` into a list of ``(getter, cleaner)`` pairs,
+        picked once per column from the type of its model field, so that
+        building a row only needs to call them.
+
+        ``getters`` replaces the default getters, which read the attributes
+        of model instances. ``raw`` leaves the values of model fields
+        uncleaned.
+        """
+        fields = get_column_fields(self.queryset.model)
+        generic = self._is_customised('_cleanval')
+        columns = []
+        for i, attr in enumerate(self.attr_list):
+            field = None if callable(attr) else fields.get(attr)
+            if getters:
+                getter = getters[i]
+            else:
+                getter = self._compile_getter(attr, field)
+            if _has_choices(attr, field):
+                getter = _choices_getter(field, getter)
+
+            if raw:
+                cleaner = (_raw_text if _has_choices(attr, field) else
+                           _raw_value)
+            elif generic or field is None:
+                cleaner = partial(self._cleanval, attr=attr)
+            else:
+                cleaner = self._compile_cleaner(attr, field)
+            columns.append((getter, cleaner))
+        return columns
+
+    def _compile_getter(self, attr, field):
+        if callable(attr):
+            return attr
+        if _has_choices(attr, field):
+            return attrgetter(attr)
+        if is_path(attr):
+            return partial(get_path_value, path=attr)
+        display = 'get_{0}_display'.format(attr)
+        if hasattr(self.queryset.model, display):
+            return methodcaller(display)
+        return attrgetter(attr)
+
+    def _compile_cleaner(self, attr, field):
+        if _has_choices(attr, field):
+            return _clean_text
+        elif isinstance(field, BOOLEAN_FIELDS):
+            return _bool_cleaner()
+        elif isinstance(field, models.DateField):
+            return _date_cleaner()
+        elif isinstance(field, TEXT_FIELDS):
+            return _clean_text
+        return partial(self._cleanval, attr=attr)
+
     def _cleanval(self, value, attr):
         if callable(value):
             value = value()
@@ -51,7 +359,9 @@ class BaseDataset(tablib.Dataset):
             if callable(attr):
                 attr = self._cleanval(attr(obj), attr)
             else:
-                if hasattr(obj, 'get_{0}_display'.format(attr)):
+                if is_path(attr):
+                    value = get_path_value(obj, attr)
+                elif hasattr(obj, 'get_{0}_display'.format(attr)):
                     value = getattr(obj, 'get_{0}_display'.format(attr))()
                 else:
                     value = getattr(obj, attr)
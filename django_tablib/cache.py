@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Caching of rendered exports.
+
+Enabled by ``settings.TABLIB_EXPORT_CACHE``::
+
+    TABLIB_EXPORT_CACHE = {
+        # alias in settings.CACHES, point it at a FileBasedCache to cache
+        # exports on disk
+        'CACHE': 'default',
+        # seconds an export stays cached
+        'TIMEOUT': 300,
+        # exports bigger than this many bytes are not cached
+        'MAX_SIZE': 10 * 1024 * 1024,
+    }
+
+Cache keys are built from the compiled SQL of the exported queryset, the
+headers, the format, the encoding, the active language and localization
+settings (cleaned values are translated and localized) and a version number
+per database table,
+which is bumped whenever a model saved or deleted with the ORM changes the
+table, so stale exports are never served. ``QuerySet.update()`` and raw SQL
+don't send signals and won't invalidate anything.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import hashlib
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import translation
+from django.utils.encoding import force_bytes
+
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:
+    # Django < 1.11
+    from django.db.models.sql.datastructures import EmptyResultSet
+
+from .compat import force_text
+from .query import get_related_lookups
+
+DEFAULTS = {
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+    'MAX_SIZE': 10 * 1024 * 1024,
+}
+
+
+def get_cache_settings():
+    """
+    Return ``settings.TABLIB_EXPORT_CACHE`` merged with the defaults, or None
+    if exports aren't cached.
+    """
+    options = getattr(settings, 'TABLIB_EXPORT_CACHE', None)
+    if options is None:
+        return None
+    return dict(DEFAULTS, **options)
+
+
+def _version_key(table):
+    return 'tablib:version:{0}'.format(table)
+
+
+def _new_version():
+    # Versions start at a random number rather than 0, so that losing a
+    # version (e.g. to cache eviction) can't bring old exports back to life.
+    return random.randint(1, 2 ** 31)
+
+
+def _get_versions(cache, tables):
+    keys = [_version_key(table) for table in tables]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_version(), None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key) for key in keys]
+
+
+def _get_tables(queryset, headers):
+    tables = set(alias.table_name
+                 for alias in queryset.query.alias_map.values())
+    tables.add(queryset.model._meta.db_table)
+    if isinstance(headers, dict):
+        attrs = headers.values()
+    else:
+        attrs = headers or []
+    # Models reached through relation paths in the headers
+    select_related, prefetch_related = get_related_lookups(queryset.model,
+                                                           attrs)
+    for path in select_related + prefetch_related:
+        model = queryset.model
+        for part in path.split('__'):
+            model = model._meta.get_field(part).related_model
+            tables.add(model._meta.db_table)
+    return sorted(tables)
+
+
+def _attr_key(attr):
+    # The repr of callables holds their address, which differs from one
+    # process to the next.
+    if not callable(attr):
+        return repr(attr)
+    code = getattr(attr, '__code__', None)
+    return '{0}.{1}:{2}'.format(
+        getattr(attr, '__module__', None),
+        getattr(attr, '__qualname__', getattr(attr, '__name__', None)),
+        code.co_firstlineno if code is not None else '')
+
+
+def get_export_digest(queryset, headers, file_type, encoding, extra=()):
+    """
+    Return a digest of the compiled SQL of ``queryset``, the headers, the
+    format, the encoding, the active language and ``extra``, or None if the
+    queryset can't return any rows.
+    """
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return None
+
+    if isinstance(headers, dict):
+        headers = sorted((force_text(header), _attr_key(attr))
+                         for header, attr in headers.items())
+    elif headers:
+        headers = [_attr_key(attr) for attr in headers]
+    parts = [sql, repr(params), repr(headers), file_type, encoding,
+             # booleans are translated, dates localized
+             force_text(translation.get_language()),
+             repr(getattr(settings, 'USE_L10N', True))]
+    parts.extend(force_text(part) for part in extra)
+    return hashlib.sha1(force_bytes('\n'.join(parts))).hexdigest()
+
+
+def get_cache_key(cache, queryset, headers, file_type, encoding):
+    """
+    Return the cache key of an export, or None if it can't be cached.
+    """
+    versions = _get_versions(cache, _get_tables(queryset, headers))
+    digest = get_export_digest(queryset, headers, file_type, encoding,
+                               [repr(versions)])
+    if digest is None:
+        return None
+    return 'tablib:export:{0}'.format(digest)
+
+
+def get_cached_export(queryset, headers, file_type, encoding, build):
+    """
+    Return the cached export of ``queryset``, calling ``build()`` to render
+    and cache it on a miss.
+    """
+    options = get_cache_settings()
+    if options is None:
+        return build()
+
+    cache = caches[options['CACHE']]
+    key = get_cache_key(cache, queryset, headers, file_type, encoding)
+    content = cache.get(key) if key else None
+    if content is None:
+        content = build()
+        if key and len(content) <= options['MAX_SIZE']:
+            cache.set(key, content, options['TIMEOUT'])
+    return content
+
+
+def invalidate_table(table):
+    """
+    Invalidate every cached export that reads from ``table``.
+    """
+    options = get_cache_settings()
+    if options is None:
+        return
+    cache = caches[options['CACHE']]
+    key = _version_key(table)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+
+
+@receiver(post_save, dispatch_uid='django_tablib.cache.post_save')
+@receiver(post_delete, dispatch_uid='django_tablib.cache.post_delete')
+def _invalidate_model(sender, **kwargs):
+    invalidate_table(sender._meta.db_table)
+
+
+@receiver(m2m_changed, dispatch_uid='django_tablib.cache.m2m_changed')
+def _invalidate_m2m(sender, instance, model, **kwargs):
+    invalidate_table(sender._meta.db_table)
+    invalidate_table(instance._meta.db_table)
+    invalidate_table(model._meta.db_table)
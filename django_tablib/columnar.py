@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Binary columnar exports for analytics tools (pandas, Spark, DuckDB...):
+Parquet and Arrow IPC files (also known as Feather v2 files), written with
+pyarrow when it is installed.
+
+Columns are typed from the model fields they read: integers stay integers,
+dates stay dates and so on, values aren't cleaned into text like they are in
+the other formats. Columns that aren't model fields (callables, properties,
+relation paths) and fields with choices, whose display values are exported,
+are text. Rows are fetched and written ``dataset.chunk_size`` at a time
+(``ROW_GROUP_SIZE`` by default), one Parquet row group or Arrow record batch
+per chunk.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from django.conf import settings
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from .compat import force_text
+from .query import get_column_fields
+
+ROW_GROUP_SIZE = 10000
+
+INTEGER_FIELDS = ('AutoField', 'BigAutoField', 'IntegerField',
+                  'BigIntegerField', 'SmallIntegerField',
+                  'PositiveIntegerField', 'PositiveSmallIntegerField',
+                  'PositiveBigIntegerField')
+
+
+def get_arrow_type(attr, field):
+    """
+    Return the Arrow type of the column reading ``attr``, whose model field
+    is ``field`` (None if it isn't a model field).
+    """
+    if field is None or (field.choices and attr == field.name):
+        return pyarrow.string()
+    if field.is_relation:
+        if attr != field.attname:
+            # the related object itself, exported as text
+            return pyarrow.string()
+        field = field.target_field
+
+    internal_type = field.get_internal_type()
+    if internal_type in INTEGER_FIELDS:
+        return pyarrow.int64()
+    elif internal_type == 'FloatField':
+        return pyarrow.float64()
+    elif internal_type == 'DecimalField':
+        return pyarrow.decimal128(field.max_digits, field.decimal_places)
+    elif internal_type in ('BooleanField', 'NullBooleanField'):
+        return pyarrow.bool_()
+    elif internal_type == 'DateTimeField':
+        return pyarrow.timestamp('us', tz='UTC' if settings.USE_TZ else None)
+    elif internal_type == 'DateField':
+        return pyarrow.date32()
+    elif internal_type == 'TimeField':
+        return pyarrow.time64('us')
+    elif internal_type == 'DurationField':
+        return pyarrow.duration('us')
+    return pyarrow.string()
+
+
+def get_arrow_schema(dataset):
+    """
+    Return the Arrow schema of the columns of ``dataset``.
+    """
+    if dataset._is_customised('_getattrs'):
+        # only gives text, see BaseDataset.iter_values
+        fields = {}
+    else:
+        fields = get_column_fields(dataset.queryset.model)
+    return pyarrow.schema([
+        pyarrow.field(force_text(header), get_arrow_type(
+            attr, None if callable(attr) else fields.get(attr)))
+        for header, attr in zip(dataset.headers, dataset.attr_list)
+    ])
+
+
+def _to_text(value):
+    return None if value is None else force_text(value)
+
+
+def iter_tables(dataset, schema):
+    """
+    Yield the rows of a lazy dataset as ``pyarrow.Table`` of at most
+    ``dataset.chunk_size`` rows.
+    """
+    size = dataset.chunk_size or ROW_GROUP_SIZE
+    converters = [_to_text if pyarrow.types.is_string(field.type) else None
+                  for field in schema]
+
+    def to_table(rows):
+        arrays = []
+        for i, (field, convert) in enumerate(zip(schema, converters)):
+            values = [row[i] for row in rows]
+            if convert is not None:
+                values = [convert(value) for value in values]
+            arrays.append(pyarrow.array(values, type=field.type))
+        return pyarrow.Table.from_arrays(arrays, schema=schema)
+
+    rows = []
+    for row in dataset.iter_values():
+        rows.append(row)
+        if len(rows) == size:
+            yield to_table(rows)
+            rows = []
+    if rows:
+        yield to_table(rows)
+
+
+def write_parquet(dataset, output):
+    """
+    Write the rows of a lazy dataset to ``output`` as a Parquet file, with a
+    row group per chunk of rows.
+    """
+    _write(dataset, output, pyarrow.parquet.ParquetWriter)
+
+
+def write_arrow(dataset, output):
+    """
+    Write the rows of a lazy dataset to ``output`` as an Arrow IPC file
+    (Feather v2), with a record batch per chunk of rows.
+    """
+    _write(dataset, output, pyarrow.RecordBatchFileWriter)
+
+
+def _write(dataset, output, writer_class):
+    schema = get_arrow_schema(dataset)
+    writer = writer_class(output, schema)
+    for table in iter_tables(dataset, schema):
+        writer.write_table(table)
+    writer.close()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Names that moved or were removed across the Django versions we support.
+"""
+from __future__ import unicode_literals
+
+from django.db import models
+
+try:
+    from django.utils.encoding import force_text
+except ImportError:
+    # Django >= 4.0
+    from django.utils.encoding import force_str as force_text
+
+try:
+    from django.utils.translation import ugettext, ugettext_lazy
+except ImportError:
+    # Django >= 4.0
+    from django.utils.translation import (gettext as ugettext,
+                                          gettext_lazy as ugettext_lazy)
+
+try:
+    from django.urls import reverse
+except ImportError:
+    # Django < 1.10
+    from django.core.urlresolvers import reverse
+
+try:
+    from django.urls import re_path as url
+except ImportError:
+    # Django < 2.0
+    from django.conf.urls import url
+
+# NullBooleanField was removed in Django 4.0 in favour of
+# BooleanField(null=True)
+BOOLEAN_FIELDS = (models.BooleanField,)
+if hasattr(models, 'NullBooleanField'):
+    BOOLEAN_FIELDS += (models.NullBooleanField,)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Compressed exports.
+
+The content of an export is compressed as it is produced, one chunk at a
+time, so that streamed exports are sent compressed without ever being
+buffered whole:
+
+``gzip``
+    sent with a ``Content-Encoding: gzip`` header, which browsers and HTTP
+    clients decode transparently, so the file keeps its name. Clients whose
+    ``Accept-Encoding`` doesn't include gzip get a gzip file named after the
+    export with a ``.gz`` extension instead.
+``zip``
+    a zip archive holding the exported file, named after it with a
+    ``.zip`` extension. Python 2 can't write zip files to a stream, the
+    archive is built in a temporary file first there.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import re
+import sys
+import tempfile
+import zipfile
+import zlib
+
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .streaming import _read_blocks
+
+COMPRESSIONS = ('gzip', 'zip')
+
+# zipfile can write to streams since Python 3.6
+ZIP_STREAMING = sys.version_info >= (3, 6)
+
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+def gzip_stream(chunks, level=zlib.Z_DEFAULT_COMPRESSION):
+    """
+    Yield ``chunks`` of bytes compressed into a gzip stream.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        # zlib holds on to small inputs until it has a block to write
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _Sink(object):
+    """
+    Unseekable file-like object keeping what is written to it until it is
+    drained, for zipfile to write archives to.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        del self.chunks[:]
+        return data
+
+
+def zip_stream(chunks, filename):
+    """
+    Yield a zip archive holding a single file named ``filename`` whose
+    content is ``chunks`` of bytes.
+    """
+    if not ZIP_STREAMING:
+        for block in _zip_file(chunks, filename):
+            yield block
+        return
+
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        # the size isn't known in advance, allow files over 4 GiB
+        with archive.open(filename, 'w', force_zip64=True) as member:
+            for chunk in chunks:
+                member.write(chunk)
+                data = sink.drain()
+                if data:
+                    yield data
+    yield sink.drain()
+
+
+def _zip_file(chunks, filename):
+    with tempfile.NamedTemporaryFile() as content:
+        for chunk in chunks:
+            content.write(chunk)
+        content.flush()
+        with tempfile.TemporaryFile() as output:
+            with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED,
+                                 allowZip64=True) as archive:
+                archive.write(content.name, filename)
+            for block in _read_blocks(output):
+                yield block
+
+
+def get_compression(request, compression):
+    """
+    Return how an export compressed with ``compression`` is sent to
+    ``request``: ``gzip`` exports are sent as ``gz`` files to clients that
+    don't accept the gzip content encoding.
+    """
+    if compression == 'gzip' and not re_accepts_gzip.search(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        return 'gz'
+    return compression
+
+
+def get_compressed_filename(filename, compression):
+    """
+    Return the name of the download of ``filename`` compressed with
+    ``compression``.
+    """
+    if compression in ('gz', 'zip'):
+        return '{0}.{1}'.format(filename, compression)
+    return filename
+
+
+def compress_response(response, compression, filename):
+    """
+    Return a streamed response sending the content of ``response``, the
+    export of the file ``filename``, compressed with ``compression`` (see
+    ``get_compression``).
+    """
+    if response.streaming:
+        content = response.streaming_content
+    else:
+        content = [response.content]
+
+    if compression == 'gzip':
+        compressed = StreamingHttpResponse(
+            gzip_stream(content), content_type=response['Content-Type'])
+        compressed['Content-Encoding'] = 'gzip'
+    elif compression == 'gz':
+        compressed = StreamingHttpResponse(gzip_stream(content),
+                                           content_type='application/gzip')
+    elif compression == 'zip':
+        compressed = StreamingHttpResponse(zip_stream(content, filename),
+                                           content_type='application/zip')
+    else:
+        raise ValueError("Unknown compression {0!r}, choose from {1}".format(
+            compression, ', '.join(COMPRESSIONS)))
+    if compression in ('gzip', 'gz'):
+        patch_vary_headers(compressed, ['Accept-Encoding'])
+    return compressed
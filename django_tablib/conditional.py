@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Conditional exports.
+
+Clients polling an export can send back the ``ETag`` of the last file they
+downloaded in an ``If-None-Match`` header (or its ``Last-Modified`` date in
+an ``If-Modified-Since`` header) and get a ``304 Not Modified`` response
+while the data hasn't changed, without any row being fetched or serialised.
+
+The validators are computed with a single aggregate query from a version
+field, a field that grows whenever a row changes such as an ``auto_now``
+``updated_at`` field: its greatest value and the number of rows, so that
+deleted rows are noticed as well. Changes that leave the version field
+alone (e.g. ``QuerySet.update()`` calls that don't set it) go unnoticed.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import calendar
+import datetime
+
+from django.db.models import Count, Max
+from django.http import HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe
+
+from .cache import get_export_digest
+
+
+def get_validators(queryset, version_field, headers=None, file_type='',
+                   encoding='', compression=None):
+    """
+    Return the ``(etag, last_modified)`` validators of the export of
+    ``queryset``. ``last_modified`` is a timestamp, only known when
+    ``version_field`` is a ``DateTimeField``; ``etag`` is None if the
+    queryset can't return any rows. Exports sent with a ``compression`` (see
+    ``django_tablib.compression.get_compression``) get an ``etag`` of their
+    own.
+    """
+    values = queryset.aggregate(version=Max(version_field),
+                                count=Count('pk'))
+    version = values['version']
+    digest = get_export_digest(queryset, headers, file_type, encoding,
+                               [repr(version), values['count']])
+    if digest is not None and compression:
+        digest = '{0}-{1}'.format(digest, compression)
+    etag = None if digest is None else '"{0}"'.format(digest)
+
+    last_modified = None
+    if isinstance(version, datetime.datetime):
+        if timezone.is_naive(version):
+            # stored in settings.TIME_ZONE when USE_TZ is off
+            version = timezone.make_aware(version,
+                                          timezone.get_default_timezone())
+        last_modified = calendar.timegm(version.utctimetuple())
+    return etag, last_modified
+
+
+def _parse_etags(header):
+    # weak comparison, as If-None-Match requires
+    etags = []
+    for etag in header.split(','):
+        etag = etag.strip()
+        if etag.startswith('W/'):
+            etag = etag[2:]
+        etags.append(etag)
+    return etags
+
+
+def is_not_modified(request, etag, last_modified):
+    """
+    Return whether the conditional headers of ``request`` match the
+    validators of the export.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = _parse_etags(if_none_match)
+        return etag is not None and ('*' in etags or etag in etags)
+
+    # If-Modified-Since is ignored along with If-None-Match
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return (if_modified_since is not None and last_modified is not None and
+            last_modified <= if_modified_since)
+
+
+def set_validators(response, etag, last_modified):
+    """
+    Add the ``ETag`` and ``Last-Modified`` headers to ``response``.
+    """
+    if etag is not None:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def not_modified(etag, last_modified):
+    """
+    Return a ``304 Not Modified`` response carrying the validators.
+    """
+    return set_validators(HttpResponseNotModified(), etag, last_modified)
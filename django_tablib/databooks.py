@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-sheet exports.
+
+A ``ModelDatabook`` is a ``tablib.Databook`` with one sheet per dataset::
+
+    class OrderBook(ModelDatabook):
+        datasets = [OrderDataset, OrderLineDataset, CustomerDataset]
+
+    OrderBook().xlsx
+
+The datasets are built concurrently, each in a thread of its own with a
+database connection of its own, so the queries of the sheets overlap. Their
+rows are still cleaned one thread at a time (the GIL), the gain is in the
+time spent waiting for the database.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import tablib
+from django.db import connections
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # Python 2 without the futures backport
+    ThreadPoolExecutor = None
+
+from .compat import force_text
+
+# formats tablib can export a databook to
+DATABOOK_FORMATS = tuple(fmt.title for fmt in tablib.formats.available
+                         if hasattr(fmt, 'export_book'))
+
+# the longest sheet title Excel accepts
+MAX_TITLE_LENGTH = 31
+
+
+def _close_connections():
+    for connection in connections.all():
+        connection.close()
+
+
+def _build_sheet(factory):
+    try:
+        return factory()
+    finally:
+        # Threads have database connections of their own, which would
+        # otherwise never be closed.
+        _close_connections()
+
+
+def build_sheets(factories, workers=None):
+    """
+    Call each of ``factories`` (``ModelDataset`` subclasses, or any callable
+    returning a dataset) and return the datasets in the same order.
+
+    The factories are called by a pool of ``workers`` threads (one per
+    factory by default). They are called one after the other in the current
+    thread inside a transaction though, since other threads couldn't see its
+    changes.
+    """
+    factories = list(factories)
+    if workers is None:
+        workers = len(factories)
+    if (ThreadPoolExecutor is None or min(workers, len(factories)) < 2 or
+            any(conn.in_atomic_block for conn in connections.all())):
+        return [factory() for factory in factories]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_build_sheet, factories))
+
+
+def get_sheet_title(dataset):
+    """
+    Return the title of the sheet of ``dataset``: its own title if it has
+    one, the verbose name of its model otherwise.
+    """
+    if dataset.title:
+        return dataset.title
+    queryset = getattr(dataset, 'queryset', None)
+    if queryset is None:
+        return None
+    title = force_text(queryset.model._meta.verbose_name_plural)
+    return title[:MAX_TITLE_LENGTH]
+
+
+class ModelDatabook(tablib.Databook):
+    """
+    A ``tablib.Databook`` with a sheet for each of ``datasets``, built
+    concurrently by ``build_sheets``. Sheets are titled after their model
+    unless the dataset has a title.
+    """
+    # ModelDataset subclasses, or any callable returning a dataset
+    datasets = []
+    # threads building the sheets, one per sheet by default
+    workers = None
+
+    def __init__(self, datasets=None, workers=None):
+        if datasets is not None:
+            self.datasets = datasets
+        if workers is not None:
+            self.workers = workers
+        sheets = build_sheets(self.datasets, workers=self.workers)
+        for dataset in sheets:
+            dataset.title = get_sheet_title(dataset)
+        super(ModelDatabook, self).__init__(sheets)
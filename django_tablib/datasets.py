@@ -5,9 +5,15 @@ from .base import BaseDataset
 
 
 class SimpleDataset(BaseDataset):
-    def __init__(self, queryset, headers=None, encoding='utf-8'):
+    def __init__(self, queryset, headers=None, encoding='utf-8', lazy=False,
+                 chunk_size=None, raw=False, server_side_cursor=False,
+                 stats=None, columnwise=False):
         self.queryset = queryset
         self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.server_side_cursor = server_side_cursor
+        self.stats = stats
+        self.columnwise = columnwise
         if headers is None:
             # We'll set the queryset to include all fields including calculated
             # aggregates using the same names as a values() queryset:
@@ -20,7 +26,11 @@ class SimpleDataset(BaseDataset):
                 # django < 1.9
                 field_names = v_qs.field_names
             headers.extend(field_names)
-            headers.extend(v_qs.query.aggregate_select)
+            # annotation_select replaced aggregate_select in Django 1.8
+            annotations = getattr(v_qs.query, 'annotation_select', None)
+            if annotations is None:
+                annotations = v_qs.query.aggregate_select
+            headers.extend(annotations)
 
             self.header_list = headers
             self.attr_list = headers
@@ -31,4 +41,4 @@ class SimpleDataset(BaseDataset):
         elif isinstance(headers, (tuple, list)):
             self.header_list = headers
             self.attr_list = headers
-        super(SimpleDataset, self).__init__()
+        super(SimpleDataset, self).__init__(lazy=lazy, raw=raw)
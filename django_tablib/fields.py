@@ -1,4 +1,9 @@
 class Field(object):
+    """
+    A dataset column. ``attribute`` is the attribute, callable or ``__``
+    separated relation path (e.g. ``customer__name``) used for the values and
+    defaults to the field name; ``header`` defaults to the field name too.
+    """
     def __init__(self, attribute=None, header=None):
         self.attribute = attribute
         self.header = header
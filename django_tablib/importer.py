@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Importing datasets back into the database, see ``ModelDataset.import_data``.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from functools import partial
+
+import tablib
+from django import forms
+from django.db import models, transaction
+
+from .cache import invalidate_table
+from .compat import BOOLEAN_FIELDS, force_text, ugettext as _
+from .query import get_column_fields
+
+
+def load_dataset(stream, format=None):
+    """
+    Parse ``stream`` into a ``tablib.Dataset``, detecting its format unless
+    ``format`` is given.
+    """
+    if format is None:
+        return tablib.import_set(stream)
+    data = tablib.Dataset()
+    setattr(data, format, stream)
+    return data
+
+
+def _empty_value(field):
+    if field.null:
+        return None
+    if field.empty_strings_allowed:
+        return ''
+    return field.get_default()
+
+
+def get_converter(field, attr):
+    """
+    Return a function turning the text of an exported cell back into a value
+    for ``field``, undoing what ``BaseDataset`` did to export it.
+    """
+    if field.choices and attr == field.name and not field.is_relation:
+        labels = dict((force_text(label), value)
+                      for value, label in field.flatchoices)
+
+        def convert(value):
+            value = force_text(value)
+            return labels[value] if value in labels else field.to_python(value)
+    elif isinstance(field, BOOLEAN_FIELDS):
+        booleans = {_("Y"): True, _("N"): False}
+
+        def convert(value):
+            value = force_text(value)
+            return booleans[value] if value in booleans else field.to_python(
+                value)
+    elif isinstance(field, models.DateTimeField):
+        # dates are exported in the localized SHORT_DATE_FORMAT
+        convert = forms.DateTimeField(localize=True).to_python
+    elif isinstance(field, models.DateField):
+        convert = forms.DateField(localize=True).to_python
+    elif field.is_relation:
+        # foreign keys are imported from their attname column (e.g.
+        # author_id), which holds the primary key of the related object
+        convert = field.target_field.to_python
+    else:
+        convert = field.to_python
+
+    def convert_cell(value):
+        if value is None or value == '':
+            return _empty_value(field)
+        return convert(value)
+    return convert_cell
+
+
+def get_import_columns(model, header_dict, headers):
+    """
+    Return ``(index, field, converter)`` for every column of an imported
+    dataset that maps to a concrete model field. Other columns (callables,
+    relation paths, properties) can't be written back and are ignored, as
+    are foreign keys exported by name (e.g. ``author``), whose cells hold
+    the text of the related object rather than its primary key.
+    """
+    fields = get_column_fields(model)
+    columns, seen = [], set()
+    for index, header in enumerate(headers):
+        attr = header_dict.get(header)
+        if callable(attr) or attr not in fields:
+            continue
+        field = fields[attr]
+        if field.is_relation and attr == field.name:
+            continue
+        # several headers may read the same field, the first one wins
+        if field.attname in seen:
+            continue
+        seen.add(field.attname)
+        columns.append((index, field, get_converter(field, attr)))
+    return columns
+
+
+def import_rows(model, header_dict, data, batch_size=500, using=None):
+    """
+    Create or update instances of ``model`` from the rows of ``data``, a
+    ``tablib.Dataset``. Rows whose primary key already exists update that
+    object, the others create new objects. Everything happens in a single
+    transaction; objects are written ``batch_size`` at a time. Cached
+    exports of ``model`` are invalidated once the transaction commits.
+
+    Returns the number of created and updated objects.
+    """
+    manager = model._default_manager.db_manager(using)
+    pk_name = model._meta.pk.name
+    columns = get_import_columns(model, header_dict, data.headers)
+    update_fields = [field.attname for index, field, convert in columns
+                     if not field.primary_key]
+    created = updated = 0
+
+    with transaction.atomic(using=manager.db):
+        for start in range(0, len(data), batch_size):
+            objects = []
+            for row in data[start:start + batch_size]:
+                values = dict((field.attname, convert(row[index]))
+                              for index, field, convert in columns)
+                objects.append(model(**values))
+
+            pks = [obj.pk for obj in objects if obj.pk is not None]
+            existing = set(manager.filter(pk__in=pks).values_list(
+                'pk', flat=True)) if pks else set()
+            to_create = [obj for obj in objects if obj.pk not in existing]
+            to_update = [obj for obj in objects if obj.pk in existing]
+
+            if to_create:
+                manager.bulk_create(to_create, batch_size=batch_size)
+            if to_update and update_fields:
+                if hasattr(manager, 'bulk_update'):
+                    manager.bulk_update(to_update, update_fields,
+                                        batch_size=batch_size)
+                else:
+                    # Django < 2.2
+                    for obj in to_update:
+                        manager.filter(**{pk_name: obj.pk}).update(**dict(
+                            (name, getattr(obj, name))
+                            for name in update_fields))
+            created += len(to_create)
+            updated += len(to_update)
+
+        # bulk writes send no post_save signal, which would invalidate the
+        # cached exports of the model
+        invalidate = partial(invalidate_table, model._meta.db_table)
+        if hasattr(transaction, 'on_commit'):
+            transaction.on_commit(invalidate, using=manager.db)
+        else:
+            # Django < 1.9
+            invalidate()
+    return created, updated
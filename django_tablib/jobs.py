@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Background export jobs.
+
+An export job builds its file outside of the request/response cycle on an
+export backend (a thread pool by default) and writes it to a
+``FileSystemStorage`` rooted at ``settings.TABLIB_EXPORT_ROOT``, next to a
+small JSON file holding the job's status and progress. Exports hold whole
+tables, so the root must not be served by the web server: it defaults to a
+directory in the system's temporary directory rather than ``MEDIA_ROOT``,
+and files are only downloaded through the admin. Jobs are deleted
+``settings.TABLIB_EXPORT_EXPIRY`` seconds (a day by default) after their
+last update, see ``purge_export_jobs``.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import six
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connections
+from django.db.models.query import QuerySet
+from django.utils.module_loading import import_string
+
+try:
+    from django.apps import apps
+    get_model = apps.get_model
+except ImportError:
+    from django.db.models.loading import get_model
+
+try:
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+except ImportError:
+    # Python 2 without the futures backport
+    ProcessPoolExecutor = ThreadPoolExecutor = None
+
+from .compat import force_text
+from .datasets import SimpleDataset
+from .streaming import streaming_formats
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# number of rows written between two updates of a job's progress
+PROGRESS_INTERVAL = 1000
+
+DEFAULT_BACKEND = 'django_tablib.jobs.ThreadPoolBackend'
+
+# seconds a job and its file are kept after the job's last update
+DEFAULT_EXPIRY = 24 * 60 * 60
+
+JOBS_DIR = 'tablib-exports'
+
+
+def get_export_root():
+    """
+    Return ``settings.TABLIB_EXPORT_ROOT``, or a directory in the system's
+    temporary directory, which unlike ``MEDIA_ROOT`` isn't served publicly.
+    """
+    root = getattr(settings, 'TABLIB_EXPORT_ROOT', None)
+    if root is None:
+        root = os.path.join(tempfile.gettempdir(), 'django-tablib')
+    return root
+
+
+def get_export_storage():
+    return FileSystemStorage(location=get_export_root())
+
+
+def _job_dir(job_id):
+    return '{0}/{1}'.format(JOBS_DIR, job_id)
+
+
+def get_job_status(job_id):
+    """
+    Return the status dict of an export job, or None if there is no such job.
+    """
+    storage = get_export_storage()
+    try:
+        with storage.open('{0}/status.json'.format(_job_dir(job_id))) as f:
+            return json.loads(f.read().decode('utf-8'))
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _save_job_status(storage, status):
+    path = storage.path('{0}/status.json'.format(_job_dir(status['id'])))
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    # Write to a temporary file first so that pollers never read a
+    # half-written status.
+    with open(path + '.tmp', 'wb') as f:
+        f.write(json.dumps(status).encode('utf-8'))
+    getattr(os, 'replace', os.rename)(path + '.tmp', path)
+
+
+def purge_export_jobs(expiry=None):
+    """
+    Delete the jobs (status and file) that haven't been updated for
+    ``expiry`` seconds (``settings.TABLIB_EXPORT_EXPIRY`` by default) and
+    return their ids. Called whenever a job is started.
+    """
+    if expiry is None:
+        expiry = getattr(settings, 'TABLIB_EXPORT_EXPIRY', DEFAULT_EXPIRY)
+    storage = get_export_storage()
+    if not storage.exists(JOBS_DIR):
+        return []
+    expired = []
+    deadline = time.time() - expiry
+    for job_id in storage.listdir(JOBS_DIR)[0]:
+        directory = storage.path(_job_dir(job_id))
+        try:
+            updated = os.path.getmtime(os.path.join(directory, 'status.json'))
+        except OSError:
+            # not written yet, or being purged by another process
+            continue
+        if updated < deadline:
+            shutil.rmtree(directory, ignore_errors=True)
+            expired.append(job_id)
+    return expired
+
+
+class BaseExportBackend(object):
+    """
+    Runs export jobs. Subclasses implement ``submit(func, *args)``, which
+    must call ``func(*args)`` at some point. The arguments are picklable as
+    long as the dataset headers are.
+    """
+    def submit(self, func, *args):
+        raise NotImplementedError
+
+
+class SynchronousBackend(BaseExportBackend):
+    """
+    Runs export jobs immediately, in the current thread. Mostly useful for
+    tests and development.
+    """
+    def submit(self, func, *args):
+        func(*args)
+
+
+def _close_connections():
+    for connection in connections.all():
+        connection.close()
+
+
+def _run_in_worker(func, *args):
+    try:
+        func(*args)
+    finally:
+        # Workers have database connections of their own, which would
+        # otherwise never be closed.
+        _close_connections()
+
+
+class ThreadPoolBackend(BaseExportBackend):
+    """
+    Runs export jobs on a pool of ``settings.TABLIB_EXPORT_WORKERS`` (2 by
+    default) threads of the current process.
+    """
+    executor_class = ThreadPoolExecutor
+
+    def __init__(self):
+        self.executor = self.executor_class(
+            max_workers=getattr(settings, 'TABLIB_EXPORT_WORKERS', 2))
+
+    def submit(self, func, *args):
+        return self.executor.submit(_run_in_worker, func, *args)
+
+
+class ProcessPoolBackend(ThreadPoolBackend):
+    """
+    Runs export jobs on a pool of worker processes. Dataset headers must be
+    picklable, so callables have to be module level functions.
+    """
+    executor_class = ProcessPoolExecutor
+
+    def submit(self, func, *args):
+        # Workers are forked on demand and must not share this process'
+        # database connections.
+        _close_connections()
+        return super(ProcessPoolBackend, self).submit(func, *args)
+
+
+_backends = {}
+
+
+def get_export_backend(path=None):
+    """
+    Return the (shared) instance of the export backend class at ``path``,
+    which defaults to ``settings.TABLIB_EXPORT_BACKEND``.
+    """
+    if path is None:
+        path = getattr(settings, 'TABLIB_EXPORT_BACKEND', DEFAULT_BACKEND)
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+def start_export_job(queryset, headers=None, file_type='csv',
+                     filename='export', encoding='utf-8', chunk_size=None,
+                     backend=None):
+    """
+    Queue the export of ``queryset`` and return the id of the new job.
+    Expired jobs are purged first.
+    """
+    purge_export_jobs()
+    opts = queryset.model._meta
+    status = {
+        'id': uuid.uuid4().hex,
+        'model': '{0}.{1}'.format(opts.app_label, opts.model_name),
+        'database': queryset.db,
+        'status': PENDING,
+        'file_type': file_type,
+        'filename': '{0}.{1}'.format(filename, file_type),
+        'encoding': encoding,
+        'rows': 0,
+        'total': None,
+        'file': None,
+        'error': None,
+    }
+    _save_job_status(get_export_storage(), status)
+    get_export_backend(backend).submit(run_export_job, status,
+                                       queryset.query, headers, chunk_size)
+    return status['id']
+
+
+def run_export_job(status, query, headers, chunk_size):
+    """
+    Build the export described by ``status`` and save it to the export
+    storage, keeping the job's status up to date along the way.
+    """
+    storage = get_export_storage()
+    queryset = QuerySet(model=get_model(status['model']), query=query,
+                        using=status['database'])
+    file_type, encoding = status['file_type'], status['encoding']
+    name = '{0}/{1}'.format(_job_dir(status['id']), status['filename'])
+    try:
+        status.update(status=RUNNING, total=queryset.count())
+        _save_job_status(storage, status)
+
+        if file_type in streaming_formats:
+            dataset = SimpleDataset(queryset, headers=headers, lazy=True,
+                                    chunk_size=chunk_size)
+
+            def counted(iter_rows):
+                def iter_counted_rows():
+                    for rows, row in enumerate(iter_rows(), 1):
+                        status['rows'] = rows
+                        if rows % PROGRESS_INTERVAL == 0:
+                            _save_job_status(storage, status)
+                        yield row
+                return iter_counted_rows
+            # columnar formats read raw values
+            dataset.iter_rows = counted(dataset.iter_rows)
+            dataset.iter_values = counted(dataset.iter_values)
+
+            with tempfile.TemporaryFile() as output:
+                for block in streaming_formats[file_type](dataset,
+                                                          encoding=encoding):
+                    output.write(block)
+                output.seek(0)
+                name = storage.save(name, File(output))
+        else:
+            dataset = SimpleDataset(queryset, headers=headers,
+                                    chunk_size=chunk_size)
+            content = getattr(dataset, file_type)
+            if isinstance(content, six.text_type):
+                content = content.encode(encoding)
+            name = storage.save(name, ContentFile(content))
+            status['rows'] = len(dataset)
+        status.update(status=DONE, file=name)
+    except Exception as e:
+        logger.exception("Export job %s failed", status['id'])
+        status.update(status=FAILED, error=force_text(e))
+    finally:
+        _save_job_status(storage, status)
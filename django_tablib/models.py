@@ -2,10 +2,11 @@
 from __future__ import unicode_literals, absolute_import
 
 import six
-from copy import deepcopy
 
 from .base import BaseDataset
 from .fields import Field
+from .importer import import_rows, load_dataset
+from .incremental import filter_since
 
 
 class NoObjectsException(Exception):
@@ -18,6 +19,10 @@ class DatasetOptions(object):
         self.queryset = getattr(options, 'queryset', None)
         self.fields = getattr(options, 'fields', [])
         self.exclude = getattr(options, 'exclude', [])
+        self.chunk_size = getattr(options, 'chunk_size', None)
+        self.raw = getattr(options, 'raw', False)
+        self.columnwise = getattr(options, 'columnwise', False)
+        self.watermark = getattr(options, 'watermark', None)
 
 
 class DatasetMetaclass(type):
@@ -32,8 +37,8 @@ class DatasetMetaclass(type):
             for p in parents:
                 parent_fields = getattr(p, 'base_fields', {})
 
-                for field_name, field_object in parent_fields.items():
-                    attrs['base_fields'][field_name] = deepcopy(field_object)
+                # fields are never modified, subclasses can share them
+                attrs['base_fields'].update(parent_fields)
         except NameError:
             pass
 
@@ -73,20 +78,78 @@ class DatasetMetaclass(type):
 class ModelDataset(six.with_metaclass(DatasetMetaclass, BaseDataset)):
 
     def __init__(self, *args, **kwargs):
-        included = [field.name for field in self.model._meta.fields]
-        if self._meta.fields:
-            included = filter(lambda x: x in self._meta.fields, included)
-        if self._meta.exclude:
-            included = filter(lambda x: x not in self._meta.exclude, included)
-
-        self.fields = dict((field, Field()) for field in included)
-
-        self.fields.update(deepcopy(self.base_fields))
+        since = kwargs.pop('since', None)
+        if self._meta.watermark:
+            # only export the rows changed since the last export, see
+            # django_tablib.incremental
+            self.queryset, self.watermark = filter_since(
+                self.queryset, self._meta.watermark, since)
+        elif since is not None:
+            raise ValueError("Exporting the rows changed since a watermark "
+                             "requires a Meta.watermark field")
+        self.chunk_size = self._meta.chunk_size
+        self.raw = self._meta.raw
+        self.columnwise = self._meta.columnwise
+        fields, header_dict, header_list = self._get_plan()
+        # copies, so that instances can be changed without affecting others
+        self.fields = dict(fields)
+        self.header_dict = dict(header_dict)
+        self.header_list = list(header_list)
+        self.attr_list = [header_dict[h] for h in header_list]
+        super(ModelDataset, self).__init__(*args, **kwargs)
 
-        self.header_dict = dict(
+    @classmethod
+    def _get_plan(cls):
+        """
+        Return the fields, header dict and header list of the dataset class,
+        resolved the first time the class is instantiated (when the model's
+        fields are known) and reused afterwards.
+        """
+        # looked up in the class' own __dict__, subclasses have plans of
+        # their own
+        plan = cls.__dict__.get('_plan')
+        if plan is None:
+            fields = cls._get_fields()
+            header_dict = cls._get_header_dict(fields)
+            plan = (fields, header_dict, list(header_dict.keys()))
+            cls._plan = plan
+        return plan
+
+    @classmethod
+    def _get_fields(cls):
+        included = [field.name for field in cls.model._meta.fields]
+        if cls._meta.fields:
+            included = [name for name in included
+                        if name in cls._meta.fields]
+        if cls._meta.exclude:
+            included = [name for name in included
+                        if name not in cls._meta.exclude]
+
+        fields = dict((field, Field()) for field in included)
+
+        fields.update(cls.base_fields)
+        return fields
+
+    @staticmethod
+    def _get_header_dict(fields):
+        return dict(
             (field.header or name, field.attribute or name)
-            for name, field in self.fields.items())
-
-        self.header_list = self.header_dict.keys()
-        self.attr_list = [self.header_dict[h] for h in self.header_list]
-        super(ModelDataset, self).__init__(*args, **kwargs)
+            for name, field in fields.items())
+
+    @classmethod
+    def import_data(cls, stream, format=None, batch_size=500, using=None):
+        """
+        Create or update objects from a file in any format tablib can read
+        (e.g. one exported from this dataset), and return the number of
+        created and updated objects.
+
+        Headers are mapped back to model fields through the dataset's
+        headers; columns whose attribute isn't a concrete model field are
+        ignored. Rows whose primary key exists update that object, other rows
+        create new ones. Objects are written ``batch_size`` at a time with
+        ``bulk_create()``/``bulk_update()``, all in one transaction. Note that
+        ``save()`` isn't called and no signals are sent.
+        """
+        data = load_dataset(stream, format=format)
+        return import_rows(cls.model, cls._get_plan()[1], data,
+                           batch_size=batch_size, using=using)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel exports.
+
+The queryset is split into primary key ranges ("shards") that are exported
+by a pool of worker processes, each with a database connection of its own,
+and the results are put back together in primary key order: CSV and JSON
+shards are concatenated as they are, other formats are merged into a single
+dataset before being rendered.
+
+Workers set Django up themselves when they are started with the ``spawn``
+method (the default on macOS and Windows), as long as the settings are found
+through ``DJANGO_SETTINGS_MODULE``. Starting processes is slow: parallel
+exports are meant for management commands and background jobs rather than
+for every request.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import pickle
+
+import django
+import tablib
+from django.db import connections
+from django.db.models import Max, Min
+from django.db.models.query import QuerySet
+
+try:
+    from django.apps import apps
+    get_model = apps.get_model
+except ImportError:
+    from django.db.models.loading import get_model
+    apps = None
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # Python 2 without the futures backport
+    ProcessPoolExecutor = None
+
+from .datasets import SimpleDataset
+from .query import can_paginate_by_pk
+from .streaming import stream_csv
+
+INTEGER_FIELDS = ('AutoField', 'BigAutoField', 'IntegerField',
+                  'BigIntegerField', 'PositiveIntegerField')
+
+
+def get_pk_ranges(queryset, shards):
+    """
+    Split the integer primary keys of ``queryset`` into at most ``shards``
+    ``(start, stop)`` ranges of equal width. Returns an empty list for empty
+    querysets.
+    """
+    bounds = queryset.aggregate(start=Min('pk'), stop=Max('pk'))
+    if bounds['start'] is None:
+        return []
+    start, stop = bounds['start'], bounds['stop'] + 1
+    width = max(1, -(-(stop - start) // shards))
+    return [(lower, min(lower + width, stop))
+            for lower in range(start, stop, width)]
+
+
+def _close_connections():
+    for connection in connections.all():
+        connection.close()
+
+
+def _setup_worker():
+    # Processes started with spawn or forkserver rather than fork begin with
+    # an empty app registry.
+    if apps is not None and not apps.ready:
+        django.setup()
+
+
+def export_shard(model_label, query, headers, file_type, encoding,
+                 chunk_size, pk_range):
+    """
+    Export the rows of a queryset whose primary key is in ``pk_range``.
+    ``query`` is the pickled ``Query`` of the queryset, which can only be
+    unpickled once Django is set up.
+
+    Returns the encoded CSV lines (without headers) for ``csv``, the JSON
+    objects (without the enclosing brackets) for ``json`` and the list of
+    rows for any other format.
+    """
+    try:
+        _setup_worker()
+        queryset = QuerySet(model=get_model(model_label),
+                            query=pickle.loads(query)).filter(
+            pk__gte=pk_range[0], pk__lt=pk_range[1])
+        dataset = SimpleDataset(queryset, headers=headers, lazy=True,
+                                chunk_size=chunk_size)
+        if file_type == 'csv':
+            lines = stream_csv(dataset, encoding=encoding)
+            next(lines)
+            return b''.join(lines)
+        rows = list(dataset.iter_rows())
+        if file_type == 'json':
+            return tablib.Dataset(*rows, headers=dataset.headers).json[1:-1]
+        return rows
+    finally:
+        _close_connections()
+
+
+def parallel_export(queryset, headers=None, file_type='csv',
+                    encoding='utf-8', workers=4, shards=None,
+                    chunk_size=None):
+    """
+    Render the export of ``queryset`` in ``file_type`` using ``workers``
+    processes, splitting it into ``shards`` primary key ranges (defaults to
+    ``workers * 4``, so that uneven ranges even out).
+
+    Only querysets with integer primary keys that are neither sliced nor
+    ordered by anything but the primary key can be split; others are
+    exported by the current process, as are exports run inside a transaction
+    (whose changes the workers couldn't see). Headers must be picklable.
+    """
+    opts = queryset.model._meta
+    if (ProcessPoolExecutor is None or workers < 2 or
+            any(conn.in_atomic_block for conn in connections.all()) or
+            not can_paginate_by_pk(queryset) or
+            opts.pk.get_internal_type() not in INTEGER_FIELDS):
+        dataset = SimpleDataset(queryset, headers=headers,
+                                chunk_size=chunk_size)
+        return getattr(dataset, file_type)
+
+    model_label = '{0}.{1}'.format(opts.app_label, opts.model_name)
+    ranges = get_pk_ranges(queryset, shards or workers * 4)
+    query = pickle.dumps(queryset.query, pickle.HIGHEST_PROTOCOL)
+
+    # Workers are forked on demand and must not share this process'
+    # database connections.
+    _close_connections()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = [
+            executor.submit(export_shard, model_label, query,
+                            headers, file_type, encoding, chunk_size,
+                            pk_range)
+            for pk_range in ranges
+        ]
+        parts = [result.result() for result in results]
+
+    # only used for its headers
+    dataset = SimpleDataset(queryset, headers=headers, lazy=True)
+    if file_type == 'csv':
+        header = next(stream_csv(dataset, encoding=encoding))
+        return header + b''.join(parts)
+    if file_type == 'json':
+        return '[{0}]'.format(', '.join(part for part in parts if part))
+
+    merged = tablib.Dataset(headers=dataset.headers)
+    for rows in parts:
+        for row in rows:
+            merged.append(row)
+    return getattr(merged, file_type)
@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import uuid
+from operator import itemgetter
+
+import django
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, transaction
+
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:
+    # Django < 1.11
+    from django.db.models.sql.datastructures import EmptyResultSet
+
+# rows fetched per round trip by server side cursors, unless a chunk_size is
+# given
+SERVER_SIDE_FETCH_SIZE = 2000
+
+
+def _is_ordered_by_pk(queryset):
+    opts = queryset.model._meta
+    query = queryset.query
+    if query.order_by:
+        ordering = list(query.order_by)
+    elif query.default_ordering:
+        ordering = list(opts.ordering)
+    else:
+        ordering = []
+    return ordering in ([], ['pk'], [opts.pk.name], [opts.pk.attname])
+
+
+def can_paginate_by_pk(queryset):
+    """
+    Return whether ``queryset`` can be walked with keyset pagination on the
+    primary key without changing the order of the results.
+    """
+    query = queryset.query
+    return (query.low_mark == 0 and query.high_mark is None and
+            not query.distinct_fields and _is_ordered_by_pk(queryset))
+
+
+def get_column_fields(model):
+    """
+    Map the ``name`` of the concrete fields of ``model``, as well as the
+    ``attname`` of its foreign keys, to the model field.
+    """
+    fields = {}
+    for field in model._meta.concrete_fields:
+        fields[field.name] = field
+        fields[field.attname] = field
+    return fields
+
+
+def can_use_values_list(queryset, attr_list):
+    """
+    Return whether every attribute in ``attr_list`` is a plain column that
+    ``queryset.values_list()`` can fetch.
+
+    Plain columns are concrete, non relational model fields, the ``attname``
+    of foreign keys (e.g. ``author_id``), annotations and extra selects.
+    """
+    model = queryset.model
+    fields = get_column_fields(model)
+    aliases = (set(queryset.query.annotation_select) |
+               set(queryset.query.extra_select))
+
+    for attr in attr_list:
+        if callable(attr):
+            return False
+        if attr in aliases:
+            continue
+        field = fields.get(attr)
+        if field is None or (field.is_relation and attr == field.name):
+            return False
+        if not field.choices and hasattr(
+                model, 'get_{0}_display'.format(attr)):
+            # a hand written display method that we can't reproduce
+            return False
+    return True
+
+
+def get_related_lookups(model, attr_list):
+    """
+    Return the ``select_related`` and ``prefetch_related`` lookups needed to
+    read every attribute in ``attr_list`` from instances of ``model`` without
+    a query per row.
+
+    Attributes may follow relations with ``__`` separated paths such as
+    ``customer__name``. Forward foreign keys and one-to-one relations are
+    joined with ``select_related``; as soon as a path crosses a reverse
+    foreign key or a many-to-many relation the rest of it is prefetched.
+    """
+    select_related, prefetch_related = set(), set()
+    for attr in attr_list:
+        if callable(attr):
+            continue
+        relations = []
+        multiple_at = None
+        current = model
+        for part in attr.split('__'):
+            try:
+                field = current._meta.get_field(part)
+            except FieldDoesNotExist:
+                break
+            if not field.is_relation or field.related_model is None:
+                break
+            relations.append(part)
+            if multiple_at is None and (field.many_to_many or
+                                        field.one_to_many):
+                multiple_at = len(relations) - 1
+            current = field.related_model
+
+        if not relations:
+            continue
+        if multiple_at is None:
+            select_related.add('__'.join(relations))
+        else:
+            if multiple_at:
+                select_related.add('__'.join(relations[:multiple_at]))
+            prefetch_related.add('__'.join(relations))
+    return sorted(select_related), sorted(prefetch_related)
+
+
+def apply_related_lookups(queryset, attr_list):
+    """
+    Add the lookups from ``get_related_lookups`` to ``queryset``.
+    """
+    select_related, prefetch_related = get_related_lookups(queryset.model,
+                                                           attr_list)
+    # select_related() with arguments would drop a bare select_related()
+    # that already follows every non-null foreign key.
+    if select_related and queryset.query.select_related is not True:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
+
+
+def is_path(attr):
+    """
+    Return whether ``attr`` is a ``__`` separated relation path such as
+    ``customer__name`` rather than a plain attribute such as ``__str__``.
+    """
+    parts = attr.split('__')
+    return len(parts) > 1 and all(parts)
+
+
+def _flatten_select_related(select_related, prefix=''):
+    for name, nested in select_related.items():
+        path = prefix + name
+        yield path
+        for nested_path in _flatten_select_related(nested, path + '__'):
+            yield nested_path
+
+
+def get_only_fields(queryset, attr_list):
+    """
+    Return the field names to pass to ``queryset.only()`` so that only the
+    columns needed for ``attr_list`` are fetched, or None if that can't be
+    worked out (e.g. for callables and properties, which could read any
+    field).
+
+    Related objects that are used as a whole (``customer``, or a property
+    such as ``customer__full_name``) are fetched with all their fields.
+    """
+    model = queryset.model
+    aliases = (set(queryset.query.annotation_select) |
+               set(queryset.query.extra_select))
+
+    paths = list(attr_list)
+    if isinstance(queryset.query.select_related, dict):
+        paths.extend(_flatten_select_related(queryset.query.select_related))
+    for lookup in queryset._prefetch_related_lookups:
+        paths.append(getattr(lookup, 'prefetch_through', lookup))
+
+    only, whole = set(), set()
+    for attr in paths:
+        if callable(attr):
+            return None
+        if attr in aliases:
+            continue
+        current = model
+        prefix = []
+        for part in (attr.split('__') if is_path(attr) else [attr]):
+            try:
+                field = current._meta.get_field(part)
+            except FieldDoesNotExist:
+                if not prefix:
+                    return None
+                whole.add('__'.join(prefix))
+                break
+            if field.many_to_many or (field.auto_created and
+                                      not field.concrete):
+                # reverse and many-to-many relations have no local column
+                break
+            if not field.concrete:
+                # e.g. a generic foreign key, built from other columns
+                if not prefix:
+                    return None
+                whole.add('__'.join(prefix))
+                break
+            prefix.append(part)
+            only.add('__'.join(prefix))
+            if not field.is_relation:
+                break
+            current = field.related_model
+        else:
+            if prefix and field.is_relation and field.concrete:
+                whole.add('__'.join(prefix))
+
+    return sorted(name for name in only
+                  if not any(name.startswith(path + '__') for path in whole))
+
+
+def apply_only(queryset, attr_list):
+    """
+    Restrict ``queryset`` to the columns from ``get_only_fields``, unless it
+    already defers fields or follows every foreign key.
+    """
+    query = queryset.query
+    if query.select_related is True or query.deferred_loading[0]:
+        return queryset
+    only = get_only_fields(queryset, attr_list)
+    if not only:
+        return queryset
+    return queryset.only(*only)
+
+
+def iterate_server_side(queryset, fetch_size=None):
+    """
+    Return an iterator over ``queryset`` that reads its rows through a
+    PostgreSQL server side cursor, ``fetch_size`` rows per round trip, or None
+    if the database isn't PostgreSQL, the queryset prefetches relations or
+    Django is older than 2.0 (see ``iterate_named_cursor``).
+    """
+    connection = connections[queryset.db]
+    # iterator() uses server side cursors on PostgreSQL since Django 1.11 but
+    # only takes a chunk_size since 2.0, it fetches 100 rows at a time before
+    if (connection.vendor != 'postgresql' or
+            queryset._prefetch_related_lookups or django.VERSION < (2, 0)):
+        return None
+    return queryset.iterator(chunk_size=fetch_size or SERVER_SIDE_FETCH_SIZE)
+
+
+def iterate_named_cursor(queryset, fetch_size=None):
+    """
+    Yield the tuples of a ``values_list()`` queryset through a named psycopg2
+    cursor that fetches ``fetch_size`` rows per round trip, for Django
+    versions whose ``iterator()`` reads the whole result set into memory or
+    can't be told how many rows to fetch.
+
+    The cursor only lives as long as the transaction that opened it, so
+    everything is read in a transaction of its own. Querysets with extra
+    selects or annotations aren't supported.
+    """
+    compiler = queryset.query.get_compiler(queryset.db)
+    try:
+        sql, params = compiler.as_sql()
+    except EmptyResultSet:
+        return
+    col_count = compiler.col_count
+    fetch_size = fetch_size or SERVER_SIDE_FETCH_SIZE
+    connection = connections[queryset.db]
+
+    with transaction.atomic(using=queryset.db):
+        connection.ensure_connection()
+        cursor = connection.connection.cursor(
+            name='tablib_{0}'.format(uuid.uuid4().hex))
+        try:
+            cursor.execute(sql, params)
+            chunks = iter(lambda: [row[:col_count] for row in
+                                   cursor.fetchmany(fetch_size)], [])
+            # results_iter() applies the database converters
+            for row in compiler.results_iter(chunks):
+                yield tuple(row)
+        finally:
+            cursor.close()
+
+
+def iterate_queryset(queryset, chunk_size=None, get_pk=None,
+                     server_side=False):
+    """
+    Iterate over the objects of ``queryset`` without filling its result cache.
+
+    Without a ``chunk_size`` this is ``queryset.iterator()``. Otherwise the
+    objects are fetched ``chunk_size`` at a time using keyset pagination on
+    the primary key (``pk > last_pk ORDER BY pk LIMIT chunk_size``), so only a
+    single chunk of model instances is ever held in memory. Querysets that
+    are sliced or ordered by something other than the primary key can't be
+    paginated that way and fall back to ``queryset.iterator()``.
+
+    ``get_pk`` returns the primary key of an item and defaults to reading its
+    ``pk`` attribute.
+
+    ``server_side`` reads the objects through a PostgreSQL server side cursor
+    instead, ``chunk_size`` rows per round trip, when ``iterate_server_side``
+    can.
+    """
+    if server_side:
+        objects = iterate_server_side(queryset, chunk_size)
+        if objects is not None:
+            for obj in objects:
+                yield obj
+            return
+
+    if not chunk_size or not can_paginate_by_pk(queryset):
+        if queryset._prefetch_related_lookups:
+            # iterator() doesn't prefetch anything, so the whole queryset has
+            # to be evaluated at once.
+            objects = queryset
+        else:
+            objects = queryset.iterator()
+        for obj in objects:
+            yield obj
+        return
+
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        for obj in chunk:
+            yield obj
+        if len(chunk) < chunk_size:
+            return
+        last_pk = get_pk(chunk[-1]) if get_pk else chunk[-1].pk
+
+
+def iterate_values(queryset, fields, chunk_size=None, server_side=False):
+    """
+    Like ``iterate_queryset`` but yield ``queryset.values_list(*fields)``
+    tuples, which skips model instantiation altogether.
+    """
+    fields = list(fields)
+    if server_side:
+        values = queryset.values_list(*fields)
+        rows = iterate_server_side(values, chunk_size)
+        query = values.query
+        if (rows is None and
+                connections[values.db].vendor == 'postgresql' and
+                not query.extra_select and not query.annotation_select):
+            rows = iterate_named_cursor(values, chunk_size)
+        if rows is not None:
+            for row in rows:
+                yield row
+            return
+
+    if not chunk_size or not can_paginate_by_pk(queryset):
+        for values in queryset.values_list(*fields).iterator():
+            yield values
+        return
+
+    # The primary key is fetched as an extra trailing column so that we know
+    # where the next chunk starts.
+    rows = iterate_queryset(queryset.values_list(*(fields + ['pk'])),
+                            chunk_size, get_pk=itemgetter(-1))
+    for values in rows:
+        yield values[:-1]
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.dispatch import Signal
+
+# Sent once an export has been built (or streamed to the client). The sender
+# is the exported model, the arguments are ``stats``, the
+# django_tablib.stats.ExportStats of the export, and ``request``.
+export_finished = Signal()
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Export instrumentation.
+
+The time an export spends in each of its phases is recorded, along with the
+number of rows exported, bytes written and SQL queries run, and sent with
+the ``django_tablib.signals.export_finished`` signal. With
+``settings.TABLIB_SERVER_TIMING`` the timings are sent to the client as a
+``Server-Timing`` header as well (except for streamed exports, whose headers
+are sent first).
+
+The phases are:
+
+``queryset``
+    building the queryset, e.g. the admin change list's
+``fetch``
+    reading rows from the database
+``rows``
+    turning database rows into dataset rows
+``serialize``
+    rendering the dataset in the export format
+
+Phases don't overlap: time spent fetching rows while serialising a streamed
+export counts as ``fetch`` only. Nothing is recorded unless a receiver is
+connected to ``export_finished`` or ``TABLIB_SERVER_TIMING`` is set.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.backends.utils import CursorWrapper
+
+from .signals import export_finished
+
+PHASES = ('queryset', 'fetch', 'rows', 'serialize')
+
+
+class CountingCursorWrapper(CursorWrapper):
+    """
+    Counts the queries run through ``cursor`` for ``counter``.
+    """
+    def __init__(self, cursor, db, counter):
+        super(CountingCursorWrapper, self).__init__(cursor, db)
+        self.counter = counter
+
+    def execute(self, sql, params=None):
+        self.counter.count += 1
+        return super(CountingCursorWrapper, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.counter.count += 1
+        return super(CountingCursorWrapper, self).executemany(sql,
+                                                              param_list)
+
+
+# methods of database connections wrapping their new cursors
+CURSOR_FACTORIES = ('make_cursor', 'make_debug_cursor')
+
+
+class QueryCounter(object):
+    """
+    Counts the queries run on ``connection`` between ``start()`` and
+    ``stop()``.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.count = 0
+        self.running = False
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def start(self):
+        self.running = True
+        if hasattr(self.connection, 'execute_wrappers'):
+            self.connection.execute_wrappers.append(self)
+            return
+        # Django < 2.0: wrap the cursors the connection makes, like
+        # CaptureQueriesContext but without logging the SQL of every query.
+        self.patched = {}
+        for name in CURSOR_FACTORIES:
+            self.patched[name] = self.connection.__dict__.get(name)
+            setattr(self.connection, name,
+                    self._counting(getattr(self.connection, name)))
+
+    def _counting(self, make_cursor):
+        def make_counting_cursor(cursor):
+            return CountingCursorWrapper(make_cursor(cursor), self.connection,
+                                         self)
+        return make_counting_cursor
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        if hasattr(self.connection, 'execute_wrappers'):
+            self.connection.execute_wrappers.remove(self)
+            return
+        for name, make_cursor in self.patched.items():
+            if make_cursor is None:
+                delattr(self.connection, name)
+            else:
+                setattr(self.connection, name, make_cursor)
+
+
+class ExportStats(object):
+    """
+    Statistics of the export of ``model`` in ``file_type``, counting the
+    queries run on the database ``using`` (the model's default database for
+    reads by default) from its first phase until the export is finished.
+    """
+    def __init__(self, model, file_type, using=None):
+        self.model = model
+        self.file_type = file_type
+        self.enabled = (getattr(settings, 'TABLIB_SERVER_TIMING', False) or
+                        export_finished.has_listeners(model))
+        # seconds spent in each phase
+        self.timings = OrderedDict((phase, 0.0) for phase in PHASES)
+        self.rows = 0
+        self.bytes = 0
+        self.queries = 0
+        self._stack = []
+        self._started = None
+        self._counter = QueryCounter(
+            connections[using or router.db_for_read(model)])
+        self._counting = False
+        self._sent = False
+
+    def _switch(self, push=None):
+        # Charge the time elapsed since the last switch to the current phase,
+        # so that nested phases are only counted once.
+        now = default_timer()
+        if self._stack:
+            self.timings[self._stack[-1]] += now - self._started
+        if push is None:
+            self._stack.pop()
+        else:
+            self._stack.append(push)
+        self._started = now
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Charge the time spent in the ``with`` block to the phase ``name``.
+        """
+        if not self.enabled:
+            yield
+            return
+        if not self._counting and not self._sent:
+            # only started here so that exports given up before their first
+            # phase have nothing to stop
+            self._counting = True
+            self._counter.start()
+        self._switch(name)
+        try:
+            yield
+        except Exception:
+            self.cancel()
+            raise
+        finally:
+            self._switch()
+
+    def timed(self, iterable, name):
+        """
+        Return ``iterable``, charging the time spent producing each item to
+        the phase ``name``. Items of the ``rows`` phase are counted.
+        """
+        if not self.enabled:
+            return iterable
+        return self._timed(iter(iterable), name)
+
+    def _timed(self, iterator, name):
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            if name == 'rows':
+                self.rows += 1
+            yield item
+
+    def server_timing(self):
+        """
+        Return the timings formatted for a ``Server-Timing`` header.
+        """
+        return ', '.join(
+            'tablib-{0};dur={1:.1f}'.format(phase, seconds * 1000)
+            for phase, seconds in self.timings.items())
+
+    def finish(self, response, request=None):
+        """
+        Record the size of ``response``, add the ``Server-Timing`` header and
+        send ``export_finished``, once the content of streamed responses has
+        been consumed. Returns ``response``.
+        """
+        if not self.enabled:
+            return response
+        if response.streaming:
+            response.streaming_content = self._count_bytes(
+                response.streaming_content, request)
+            response.close = self._closing(response.close, request)
+            return response
+
+        self.bytes = len(response.content)
+        self._send(request)
+        if getattr(settings, 'TABLIB_SERVER_TIMING', False):
+            response['Server-Timing'] = self.server_timing()
+        return response
+
+    def _count_bytes(self, content, request):
+        for chunk in self.timed(content, 'serialize'):
+            self.bytes += len(chunk)
+            yield chunk
+        self._send(request)
+
+    def _closing(self, close, request):
+        def close_response():
+            close()
+            # when the client went away before the end of the content, or
+            # even before its start
+            self._send(request)
+        return close_response
+
+    def _send(self, request):
+        if self._sent:
+            return
+        self._sent = True
+        self.cancel()
+        self.queries = self._counter.count
+        export_finished.send(sender=self.model, stats=self, request=request)
+
+    def cancel(self):
+        """
+        Stop counting queries, for exports that failed.
+        """
+        self._counter.stop()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import tempfile
+
+import six
+from tablib.compat import csv
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+from . import columnar
+
+# size of the blocks files are sent in
+FILE_BLOCK_SIZE = 64 * 1024
+
+
+class Echo(object):
+    """
+    File-like object that hands back whatever is written to it, so that a
+    csv writer can encode one row at a time without buffering the output.
+    """
+    def write(self, value):
+        return value
+
+
+def stream_csv(dataset, encoding='utf-8'):
+    """
+    Yield the headers and rows of a lazy dataset as encoded CSV lines
+    """
+    if six.PY2:
+        # tablib uses unicodecsv on Python 2, which encodes for us.
+        writer = csv.writer(Echo(), encoding=encoding)
+
+        def encode(line):
+            return line
+    else:
+        writer = csv.writer(Echo())
+
+        def encode(line):
+            return line.encode(encoding)
+
+    yield encode(writer.writerow(dataset.headers))
+    for row in dataset.iter_rows():
+        yield encode(writer.writerow(row))
+
+
+def stream_xlsx(dataset, encoding='utf-8'):
+    """
+    Yield an xlsx workbook holding the rows of a lazy dataset.
+
+    Rows are written one at a time by openpyxl's write-only workbook, which
+    keeps them in a temporary file rather than in memory. The xlsx format
+    being a zip file, nothing can be sent before the last row is written.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(dataset.headers))
+    for row in dataset.iter_rows():
+        sheet.append(row)
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        for block in _read_blocks(output):
+            yield block
+
+
+def stream_parquet(dataset, encoding='utf-8'):
+    """
+    Yield a Parquet file holding the typed rows of a lazy dataset, see
+    ``django_tablib.columnar``. ``encoding`` is ignored, text is UTF-8.
+    """
+    with tempfile.TemporaryFile() as output:
+        columnar.write_parquet(dataset, output)
+        for block in _read_blocks(output):
+            yield block
+
+
+def stream_arrow(dataset, encoding='utf-8'):
+    """
+    Yield an Arrow IPC file holding the typed rows of a lazy dataset, see
+    ``django_tablib.columnar``. ``encoding`` is ignored, text is UTF-8.
+    """
+    with tempfile.TemporaryFile() as output:
+        columnar.write_arrow(dataset, output)
+        for block in _read_blocks(output):
+            yield block
+
+
+def _read_blocks(output):
+    output.seek(0)
+    return iter(lambda: output.read(FILE_BLOCK_SIZE), b'')
+
+
+streaming_formats = {
+    'csv': stream_csv,
+}
+if Workbook is not None:
+    streaming_formats['xlsx'] = stream_xlsx
+if columnar.pyarrow is not None:
+    streaming_formats['parquet'] = stream_parquet
+    streaming_formats['arrow'] = stream_arrow
@@ -3,7 +3,8 @@ from __future__ import absolute_import, unicode_literals
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
-from django.http import Http404, HttpResponse, HttpResponseBadRequest
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         StreamingHttpResponse)
 
 try:
     from django.apps import apps
@@ -12,30 +13,191 @@ except ImportError:
     from django.db.models.loading import get_model
 
 from .base import get_content_type
+from .cache import get_cached_export
+from .compression import (COMPRESSIONS, compress_response,
+                          get_compressed_filename, get_compression)
+from .conditional import (get_validators, is_not_modified, not_modified,
+                          set_validators)
+from .databooks import DATABOOK_FORMATS, ModelDatabook
 from .datasets import SimpleDataset
+from .incremental import (WATERMARK_HEADER, dump_watermark, filter_since,
+                          load_watermark)
+from .parallel import parallel_export
+from .stats import ExportStats
+from .streaming import streaming_formats
 
 
 def export(request, queryset=None, model=None, headers=None, file_type='xls',
-           filename='export', encoding='utf-8'):
+           filename='export', encoding='utf-8', stream=False,
+           chunk_size=None, cache=True, workers=None,
+           server_side_cursor=False, stats=None, version_field=None,
+           compression=None):
+    """
+    Export a queryset as a file download.
+
+    When ``stream`` is true and ``file_type`` can be streamed (see
+    ``django_tablib.streaming.streaming_formats``) rows are fetched from the
+    database and encoded one at a time, and the output is sent through a
+    ``StreamingHttpResponse``. Other formats are always built in memory.
+    Formats that tablib doesn't know, such as the ``parquet`` and ``arrow``
+    formats of ``django_tablib.columnar``, are always streamed, and so is
+    ``xlsx`` when openpyxl is installed.
+
+    ``chunk_size`` limits how many model instances are fetched from the
+    database at a time, see ``django_tablib.query.iterate_queryset``.
+    ``server_side_cursor`` fetches them through a server side cursor on
+    PostgreSQL instead of keyset pagination.
+
+    ``workers`` builds buffered exports with that many processes, see
+    ``django_tablib.parallel``. It is off by default: starting processes
+    is only worth it for very large exports.
+
+    Buffered exports are cached when ``settings.TABLIB_EXPORT_CACHE`` is set
+    (see ``django_tablib.cache``), unless ``cache`` is false.
+
+    The timings of the export are recorded by ``stats``, a
+    ``django_tablib.stats.ExportStats`` created for the export unless given.
+
+    With a ``version_field``, responses carry ``ETag`` and ``Last-Modified``
+    headers and a ``304 Not Modified`` response is returned to conditional
+    requests while the data hasn't changed, see
+    ``django_tablib.conditional``.
+
+    ``compression`` (``'gzip'`` or ``'zip'``) compresses the export as it is
+    sent, see ``django_tablib.compression``.
+    """
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError("Unknown compression {0!r}, choose from {1}".format(
+            compression, ', '.join(COMPRESSIONS)))
+    if compression:
+        compression = get_compression(request, compression)
+    if not hasattr(SimpleDataset, file_type):
+        if file_type not in streaming_formats:
+            raise Http404
+        stream = True
+    if file_type == 'xlsx':
+        # the write-only workbook is never worse than tablib's
+        stream = True
+    stream = stream and file_type in streaming_formats
+    filename = '{0}.{1}'.format(filename, file_type)
+
     if queryset is None:
         queryset = model.objects.all()
+    if stats is None:
+        stats = ExportStats(queryset.model, file_type, using=queryset.db)
 
-    dataset = SimpleDataset(queryset, headers=headers)
-    filename = '{0}.{1}'.format(filename, file_type)
-    if not hasattr(dataset, file_type):
-        raise Http404
+    etag = last_modified = None
+    if version_field:
+        with stats.phase('queryset'):
+            etag, last_modified = get_validators(
+                queryset, version_field, headers=headers,
+                file_type=file_type, encoding=encoding,
+                compression=compression)
+        if is_not_modified(request, etag, last_modified):
+            return stats.finish(not_modified(etag, last_modified), request)
 
     response_kwargs = {
         'content_type': get_content_type(file_type, encoding=encoding)
     }
 
-    response = HttpResponse(getattr(dataset, file_type), **response_kwargs)
+    def build():
+        if workers:
+            with stats.phase('serialize'):
+                return parallel_export(queryset, headers=headers,
+                                       file_type=file_type, encoding=encoding,
+                                       workers=workers, chunk_size=chunk_size)
+        with stats.phase('rows'):
+            dataset = SimpleDataset(queryset, headers=headers,
+                                    chunk_size=chunk_size,
+                                    server_side_cursor=server_side_cursor,
+                                    stats=stats)
+        with stats.phase('serialize'):
+            return getattr(dataset, file_type)
+
+    try:
+        if stream:
+            dataset = SimpleDataset(queryset, headers=headers, lazy=True,
+                                    chunk_size=chunk_size,
+                                    server_side_cursor=server_side_cursor,
+                                    stats=stats)
+            response = StreamingHttpResponse(
+                streaming_formats[file_type](dataset, encoding=encoding),
+                **response_kwargs)
+        elif cache:
+            response = HttpResponse(
+                get_cached_export(queryset, headers, file_type, encoding,
+                                  build),
+                **response_kwargs)
+        else:
+            response = HttpResponse(build(), **response_kwargs)
+    except Exception:
+        stats.cancel()
+        raise
+
+    if compression:
+        response = compress_response(response, compression, filename)
+        filename = get_compressed_filename(filename, compression)
+
+    response['Content-Disposition'] = 'attachment; filename="{0}"'.format(
+        filename)
+    set_validators(response, etag, last_modified)
+    return stats.finish(response, request)
+
+
+def export_databook(request, datasets, file_type='xlsx', filename='export',
+                    encoding='utf-8', workers=None, compression=None):
+    """
+    Export a workbook with a sheet per dataset as a file download.
 
+    ``datasets`` are ``ModelDataset`` subclasses or callables returning a
+    dataset, built by ``workers`` threads, see
+    ``django_tablib.databooks.ModelDatabook``. ``file_type`` is one of
+    ``DATABOOK_FORMATS``.
+    """
+    if file_type not in DATABOOK_FORMATS:
+        raise Http404
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError("Unknown compression {0!r}, choose from {1}".format(
+            compression, ', '.join(COMPRESSIONS)))
+    if compression:
+        compression = get_compression(request, compression)
+    book = ModelDatabook(datasets, workers=workers)
+    response = HttpResponse(
+        getattr(book, file_type),
+        content_type=get_content_type(file_type, encoding=encoding))
+    filename = '{0}.{1}'.format(filename, file_type)
+    if compression:
+        response = compress_response(response, compression, filename)
+        filename = get_compressed_filename(filename, compression)
     response['Content-Disposition'] = 'attachment; filename="{0}"'.format(
         filename)
     return response
 
 
+DEFAULT_EXPORT_OPTIONS = {
+    'FILE_TYPE': 'xls',
+    'STREAM': False,
+    'SERVER_SIDE_CURSOR': False,
+    'FETCH_SIZE': None,
+    'WATERMARK': None,
+    'VERSION_FIELD': None,
+    'COMPRESSION': None,
+}
+
+
+def get_export_options(model_name):
+    """
+    Return the options of the generic export of ``model_name``:
+    ``settings.TABLIB_MODEL_OPTIONS[model_name]`` on top of
+    ``settings.TABLIB_EXPORT_OPTIONS`` on top of the defaults.
+    """
+    options = dict(DEFAULT_EXPORT_OPTIONS)
+    options.update(getattr(settings, 'TABLIB_EXPORT_OPTIONS', {}))
+    options.update(
+        getattr(settings, 'TABLIB_MODEL_OPTIONS', {}).get(model_name, {}))
+    return options
+
+
 def generic_export(request, model_name=None):
     """
     Generic view configured through settings.TABLIB_MODELS
@@ -53,8 +215,52 @@ def generic_export(request, model_name=None):
            }
         3. Open ``/export/myapp.simple`` or
            ``/export/myapp.related/?simple__title__iexact=test``
+
+    Exports are configured for every model with
+    ``settings.TABLIB_EXPORT_OPTIONS`` and per model with
+    ``settings.TABLIB_MODEL_OPTIONS``::
+
+        TABLIB_MODEL_OPTIONS = {
+            'myapp.simple': {
+                'FILE_TYPE': 'csv',
+                # stream the rows read by a PostgreSQL server side cursor
+                'SERVER_SIDE_CURSOR': True,
+                # rows per round trip (or per chunk on other databases)
+                'FETCH_SIZE': 5000,
+                # enable incremental exports, see django_tablib.incremental
+                'WATERMARK': 'updated_at',
+                # answer conditional requests, see django_tablib.conditional
+                # (defaults to the WATERMARK field)
+                'VERSION_FIELD': 'updated_at',
+                # 'gzip' or 'zip', see django_tablib.compression
+                'COMPRESSION': 'gzip',
+            },
+        }
+
+    Clients can ask for a compressed export with ``?compression=gzip`` or
+    ``?compression=zip`` as well.
+
+    With a ``WATERMARK`` field, responses carry a watermark token in an
+    ``X-Tablib-Watermark`` header; pass it back as ``?since=<token>`` to only
+    export the rows changed since.
     """
+    prepared = prepare_generic_export(request, model_name)
+    if not isinstance(prepared, dict):
+        # a bad request
+        return prepared
+    watermark = prepared.pop('watermark')
+    response = export(request, **prepared)
+    if watermark is not None:
+        response[WATERMARK_HEADER] = watermark
+    return response
+
 
+def prepare_generic_export(request, model_name):
+    """
+    Return the arguments of ``export`` for the generic export of
+    ``model_name`` requested by ``request``, along with the ``watermark``
+    token to send back if any, or an ``HttpResponseBadRequest``.
+    """
     if model_name not in settings.TABLIB_MODELS:
         raise Http404()
 
@@ -65,12 +271,22 @@ def generic_export(request, model_name=None):
             " could not be loaded".format(model_name))
 
     qs = model._default_manager.all()
+    options = get_export_options(model_name)
+    watermark_field = options['WATERMARK']
 
     # Filtering may be allowed based on TABLIB_MODELS:
     filter_settings = settings.TABLIB_MODELS[model_name]
     filters = {}
 
+    compression = request.GET.get('compression', options['COMPRESSION'])
+    if compression and compression not in COMPRESSIONS:
+        return HttpResponseBadRequest(
+            "compression may only be one of {0}".format(
+                " ".join(COMPRESSIONS)))
+
     for k, v in request.GET.items():
+        if k == 'compression' or (k == 'since' and watermark_field):
+            continue
         try:
             # Allow joins (they'll be checked below) but chop off the trailing
             # lookup operator:
@@ -95,4 +311,26 @@ def generic_export(request, model_name=None):
     if filters:
         qs = qs.filter(**filters)
 
-    return export(request, model=model, queryset=qs)
+    if watermark_field:
+        since = request.GET.get('since')
+        if since:
+            try:
+                since = load_watermark(model, watermark_field, since)
+            except ValueError as e:
+                return HttpResponseBadRequest(str(e))
+        qs, watermark = filter_since(qs, watermark_field, since or None)
+    else:
+        watermark = None
+
+    return {
+        'model': model,
+        'queryset': qs,
+        'file_type': options['FILE_TYPE'],
+        'stream': options['STREAM'] or options['SERVER_SIDE_CURSOR'],
+        'chunk_size': options['FETCH_SIZE'],
+        'server_side_cursor': options['SERVER_SIDE_CURSOR'],
+        'version_field': options['VERSION_FIELD'] or watermark_field,
+        'compression': compression or None,
+        'watermark': (None if watermark is None else
+                      dump_watermark(model, watermark)),
+    }
@@ -29,5 +29,5 @@ setup(
     ],
     packages=['django_tablib', ],
     package_data={'django_tablib': ['templates/tablib/*', 'admin/*'], },
-    install_requires=['tablib', 'six'],
+    install_requires=['tablib', 'six', 'futures; python_version < "3"'],
 )
@@ -8,5 +8,6 @@ from .models import TestModel
 
 class TestModelAdmin(TablibAdmin):
     actions = [xls_export_action, csv_export_action]
+    formats = ['csv', 'xls']
 
 admin.site.register(TestModel, TestModelAdmin)
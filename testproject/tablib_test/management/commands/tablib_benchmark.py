@@ -0,0 +1,322 @@
+from __future__ import print_function
+
+import datetime
+import decimal
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from operator import itemgetter
+
+import django
+import tablib
+from django.contrib import admin
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+
+from django_tablib.admin import TablibAdmin, actions
+from django_tablib.base import mimetype_map
+from django_tablib.columnwise import iter_rows as iter_columnwise
+from django_tablib.datasets import SimpleDataset
+from django_tablib.parallel import parallel_export
+from django_tablib.signals import export_finished
+from django_tablib.stats import QueryCounter
+from django_tablib.streaming import stream_csv, streaming_formats
+from django_tablib.views import export
+
+from ...models import TestMixedModel, TestModel, TestTypedModel
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+# xlwt can't write more rows than this to a sheet
+XLS_MAX_ROWS = 65535
+
+MIXED_HEADERS = ['id', 'test__field1', 'name', 'status', 'flag', 'created',
+                 'amount']
+
+
+def measure(func):
+    """
+    Run ``func`` and return its wall time in seconds, the peak amount of
+    memory allocated while it ran, in bytes, and the number of queries it
+    ran.
+    """
+    counter = QueryCounter(connection)
+    tracemalloc.start()
+    counter.start()
+    started = time.time()
+    try:
+        func()
+        elapsed = time.time() - started
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        counter.stop()
+        tracemalloc.stop()
+    return elapsed, peak, counter.count
+
+
+def consume(response):
+    """
+    Read the whole content of an export ``response`` and return its size.
+    """
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = ("Measure the time and peak memory needed to build datasets from "
+            "querysets of several sizes, in a throwaway test database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='10000,100000,1000000',
+            help="Comma separated list of row counts to benchmark.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help="Chunk size to compare against a whole queryset build.")
+        parser.add_argument(
+            '--per-row', type=int, metavar='ROWS',
+            help="Instead, compare the per-row cost of _getattrs(), the "
+                 "compiled column plan and the column-wise build over ROWS "
+                 "in-memory objects.")
+        parser.add_argument(
+            '--workers',
+            help="Instead, compare parallel CSV exports with these comma "
+                 "separated numbers of worker processes.")
+        parser.add_argument(
+            '--suite', action='store_true',
+            help="Instead, export a model with foreign key, choices, date, "
+                 "boolean and decimal columns in every format, buffered, "
+                 "streamed and through the admin actions.")
+        parser.add_argument(
+            '--formats', default=','.join(sorted(mimetype_map)),
+            help="Comma separated list of the formats benchmarked by "
+                 "--suite.")
+        parser.add_argument(
+            '--json', metavar='PATH',
+            help="Also write the results to PATH as JSON, to compare runs.")
+
+    def handle(self, *args, **options):
+        if options['per_row']:
+            return self.per_row(options['per_row'])
+
+        if tracemalloc is None:
+            raise CommandError("tablib_benchmark requires Python 3.4+")
+
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        chunk_size = options['chunk_size']
+
+        # The test database lives in a file so that worker processes can
+        # share it.
+        directory = tempfile.mkdtemp()
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(
+            directory, 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0,
+                                                      autoclobber=True)
+        results = []
+        try:
+            for size in sizes:
+                if options['suite']:
+                    self.populate_mixed(size)
+                    scenarios = self.suite_scenarios(
+                        options['formats'].split(','), size, chunk_size)
+                elif options['workers']:
+                    self.populate(size)
+                    scenarios = self.parallel_scenarios(
+                        [int(n) for n in options['workers'].split(',')],
+                        chunk_size)
+                else:
+                    self.populate(size)
+                    scenarios = self.scenarios(chunk_size)
+                for label, func in scenarios:
+                    results.append(self.run(size, label, func))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(directory)
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump({
+                    'environment': {
+                        'python': platform.python_version(),
+                        'django': django.get_version(),
+                        'tablib': tablib.__version__,
+                        'database': connection.vendor,
+                        'chunk_size': chunk_size,
+                        'date': datetime.datetime.now().isoformat(),
+                    },
+                    'results': results,
+                }, f, indent=2, sort_keys=True)
+
+    def run(self, size, label, func):
+        """
+        Measure a scenario, print and return its results.
+        """
+        collected = []
+
+        def receiver(sender, stats, **kwargs):
+            collected.append(stats)
+        export_finished.connect(receiver, weak=False)
+        try:
+            elapsed, peak, queries = measure(func)
+        except Exception as e:
+            # e.g. a format whose library isn't compatible
+            self.stdout.write('{0:>9} rows  {1:<18} failed: {2!r}'.format(
+                size, label, e))
+            return {'rows': size, 'scenario': label, 'error': repr(e)}
+        finally:
+            export_finished.disconnect(receiver)
+
+        result = {
+            'rows': size,
+            'scenario': label,
+            'seconds': elapsed,
+            'rows_per_second': size / elapsed if elapsed else None,
+            'peak_memory': peak,
+            'queries': queries,
+        }
+        if collected:
+            result['bytes'] = collected[-1].bytes
+            result['timings'] = dict(collected[-1].timings)
+        self.stdout.write(
+            '{0:>9} rows  {1:<18} {2:8.2f}s  {3:10.1f} MiB  {4:>6} '
+            'queries'.format(size, label, elapsed, peak / 1024.0 / 1024.0,
+                             queries))
+        return result
+
+    def per_row(self, rows):
+        headers = ['id', 'status', 'flag', 'created', 'amount']
+        dataset = SimpleDataset(TestTypedModel.objects.none(),
+                                headers=headers, lazy=True)
+        today = datetime.date.today()
+        objects = [TestTypedModel(id=i, status='nd'[i % 2], flag=i % 2 == 0,
+                                  created=today, amount=i)
+                   for i in range(rows)]
+        columns = dataset._compile_columns()
+        # the values_list() tuples of the fast path
+        values = [tuple(getattr(obj, attr) for attr in headers)
+                  for obj in objects]
+        value_columns = dataset._compile_columns(
+            [itemgetter(i) for i in range(len(headers))])
+
+        def getattrs():
+            for obj in objects:
+                dataset._getattrs(obj)
+
+        def compiled():
+            for obj in objects:
+                [clean(get(obj)) for get, clean in columns]
+
+        def values_list():
+            for row in values:
+                [clean(get(row)) for get, clean in value_columns]
+
+        def columnwise():
+            for row in iter_columnwise(dataset, values):
+                pass
+
+        for label, func in (('_getattrs', getattrs), ('compiled', compiled),
+                            ('values', values_list),
+                            ('columnwise', columnwise)):
+            started = time.time()
+            func()
+            elapsed = time.time() - started
+            self.stdout.write('{0:<10} {1:8.2f} us/row'.format(
+                label, elapsed / rows * 1000000))
+
+    def scenarios(self, chunk_size):
+        headers = ['id', 'field1']
+
+        def build(**kwargs):
+            return lambda: SimpleDataset(TestModel.objects.all(),
+                                         headers=headers, **kwargs)
+
+        def stream():
+            dataset = SimpleDataset(TestModel.objects.all(), headers=headers,
+                                    lazy=True, chunk_size=chunk_size)
+            for line in stream_csv(dataset):
+                pass
+
+        return [
+            ('whole queryset', build()),
+            ('chunk_size={0}'.format(chunk_size),
+             build(chunk_size=chunk_size)),
+            ('streamed csv', stream),
+        ]
+
+    def parallel_scenarios(self, workers, chunk_size):
+        def export(count):
+            return lambda: parallel_export(
+                TestModel.objects.all(), headers=['id', 'field1'],
+                file_type='csv', workers=count, chunk_size=chunk_size)
+
+        return [('workers={0}'.format(count), export(count))
+                for count in workers]
+
+    def suite_scenarios(self, formats, size, chunk_size):
+        request = RequestFactory().get('/export/')
+        modeladmin = TablibAdmin(TestMixedModel, admin.site)
+        modeladmin.export_chunk_size = chunk_size
+        scenarios = []
+
+        def buffered(file_type):
+            return lambda: consume(export(
+                request, queryset=TestMixedModel.objects.all(),
+                headers=MIXED_HEADERS, file_type=file_type, cache=False))
+
+        def streamed(file_type):
+            return lambda: consume(export(
+                request, queryset=TestMixedModel.objects.all(),
+                headers=MIXED_HEADERS, file_type=file_type, stream=True,
+                chunk_size=chunk_size))
+
+        def action(func):
+            return lambda: consume(func(modeladmin, request,
+                                        TestMixedModel.objects.all()))
+
+        for file_type in formats:
+            if file_type == 'xls' and size > XLS_MAX_ROWS:
+                continue
+            if hasattr(SimpleDataset, file_type):
+                scenarios.append((file_type, buffered(file_type)))
+            if file_type in streaming_formats:
+                scenarios.append(('{0} streamed'.format(file_type),
+                                  streamed(file_type)))
+            func = getattr(actions, '{0}_export_action'.format(file_type),
+                           None)
+            if func is not None:
+                scenarios.append(('{0} action'.format(file_type),
+                                  action(func)))
+        return scenarios
+
+    def populate_mixed(self, size):
+        TestMixedModel.objects.all().delete()
+        TestModel.objects.all().delete()
+        today = datetime.date.today()
+        with transaction.atomic():
+            parents = [TestModel.objects.create(field1='parent {0}'.format(i))
+                       for i in range(100)]
+            for start in range(0, size, 10000):
+                TestMixedModel.objects.bulk_create(
+                    TestMixedModel(
+                        test=parents[i % 100], name='name {0}'.format(i),
+                        status='nps'[i % 3], flag=i % 2 == 0,
+                        created=today - datetime.timedelta(days=i % 1000),
+                        amount=decimal.Decimal(i) / 100)
+                    for i in range(start, min(start + 10000, size)))
+
+    def populate(self, size):
+        TestModel.objects.all().delete()
+        with transaction.atomic():
+            for start in range(0, size, 10000):
+                TestModel.objects.bulk_create(
+                    TestModel(field1='value {0}'.format(i))
+                    for i in range(start, min(start + 10000, size)))
@@ -3,3 +3,41 @@ from django.db import models
 
 class TestModel(models.Model):
     field1 = models.TextField()
+
+
+class TestTypedModel(models.Model):
+    STATUS_CHOICES = (
+        ('n', 'New'),
+        ('d', 'Done'),
+    )
+
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES)
+    flag = models.BooleanField(default=False)
+    created = models.DateField(null=True)
+    amount = models.IntegerField(null=True)
+
+
+class TestRelatedModel(models.Model):
+    test = models.ForeignKey(TestModel, related_name='related',
+                             on_delete=models.CASCADE)
+    name = models.CharField(max_length=100)
+
+
+class TestMixedModel(models.Model):
+    """
+    A model with one column of each kind the cleaners treat differently,
+    used by the tablib_benchmark command.
+    """
+    STATUS_CHOICES = (
+        ('n', 'New'),
+        ('p', 'Paid'),
+        ('s', 'Shipped'),
+    )
+
+    test = models.ForeignKey(TestModel, related_name='mixed',
+                             on_delete=models.CASCADE)
+    name = models.CharField(max_length=100)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES)
+    flag = models.BooleanField(default=False)
+    created = models.DateField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -1,8 +1,50 @@
-from django.test import TestCase
+import datetime
+import decimal
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import types
+import unittest
+import warnings
+import zipfile
+import zlib
+from functools import partial
 
-from django_tablib import ModelDataset, Field
+import django
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.models import Count
+from django.http import Http404
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import translation
 
-from .models import TestModel
+from django_tablib import (ModelDatabook, ModelDataset, Field, TablibAdmin,
+                           columnar, jobs, streaming)
+from django_tablib.admin import actions
+from django_tablib.cache import get_cache_key
+from django_tablib.compat import reverse
+from django_tablib.datasets import SimpleDataset
+from django_tablib.parallel import get_pk_ranges, parallel_export
+from django_tablib.query import iterate_server_side, iterate_values
+from django_tablib.signals import export_finished
+from django_tablib.views import export, generic_export
+
+from .models import (TestMixedModel, TestModel, TestRelatedModel,
+                     TestTypedModel)
+
+if django.VERSION >= (4, 2):
+    from asgiref.sync import async_to_sync
+    from django_tablib import async_views
 
 
 class DjangoTablibTestCase(TestCase):
@@ -27,6 +69,15 @@ class DjangoTablibTestCase(TestCase):
 
         self.assertEqual(data[0][0], data[0][1])
 
+    def test_annotations_are_headers(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            data = SimpleDataset(
+                TestModel.objects.annotate(related_count=Count('related')))
+
+        self.assertEqual(data.headers, ['id', 'field1', 'related_count'])
+        self.assertEqual(caught, [])
+
     def test_meta_fields(self):
         class TestModelDataset(ModelDataset):
             class Meta:
@@ -63,3 +114,1092 @@ class DjangoTablibTestCase(TestCase):
         self.assertEqual(len(data.headers), 1)
         self.assertFalse('id' in data.headers)
         self.assertTrue('field1' in data.headers)
+
+
+class FieldPlanTestCase(TestCase):
+    def test_fields_are_resolved_once_per_class(self):
+        class TestModelDataset(ModelDataset):
+            field1 = Field(header='Field 1')
+
+            class Meta:
+                model = TestModel
+
+        class SubDataset(TestModelDataset):
+            class Meta:
+                model = TestModel
+                fields = ['id']
+
+        data = TestModelDataset()
+        data.fields.clear()
+
+        self.assertIs(TestModelDataset._get_plan(),
+                      TestModelDataset._get_plan())
+        self.assertEqual(sorted(TestModelDataset().header_list),
+                         ['Field 1', 'id'])
+        self.assertEqual(sorted(SubDataset().header_list), ['Field 1', 'id'])
+        self.assertIs(SubDataset.base_fields['field1'],
+                      TestModelDataset.base_fields['field1'])
+
+
+class ChunkedDatasetTestCase(TestCase):
+    def setUp(self):
+        for value in ('c', 'a', 'b'):
+            TestModel.objects.create(field1=value)
+
+    def test_chunked_build_matches_whole_queryset(self):
+        whole = SimpleDataset(TestModel.objects.all(),
+                              headers=['id', 'field1'])
+        queryset = TestModel.objects.all()
+        with self.assertNumQueries(2):
+            chunked = SimpleDataset(queryset, headers=['id', 'field1'],
+                                    chunk_size=2)
+
+        self.assertEqual(chunked.dict, whole.dict)
+        self.assertIsNone(queryset._result_cache)
+
+    def test_chunked_build_keeps_custom_ordering(self):
+        queryset = TestModel.objects.order_by('field1')
+        with self.assertNumQueries(1):
+            data = SimpleDataset(queryset, headers=['field1'], chunk_size=2)
+
+        self.assertEqual(data['field1'], ['a', 'b', 'c'])
+
+
+class RelatedPathTestCase(TestCase):
+    def setUp(self):
+        for i in range(3):
+            test = TestModel.objects.create(field1='test {0}'.format(i))
+            TestRelatedModel.objects.create(test=test, name='a{0}'.format(i))
+            TestRelatedModel.objects.create(test=test, name='b{0}'.format(i))
+
+    def test_forward_path_is_selected_related(self):
+        class RelatedDataset(ModelDataset):
+            test_value = Field(attribute='test__field1')
+
+            class Meta:
+                model = TestRelatedModel
+
+        with self.assertNumQueries(1):
+            data = RelatedDataset()
+
+        self.assertEqual(data['test_value'][0], 'test 0')
+
+    def test_reverse_path_is_prefetched(self):
+        class TestModelDataset(ModelDataset):
+            names = Field(attribute='related__name')
+
+            class Meta:
+                model = TestModel
+                fields = ['field1']
+
+        with self.assertNumQueries(2):
+            data = TestModelDataset()
+
+        self.assertEqual(sorted(data['names']), ['a0, b0', 'a1, b1', 'a2, b2'])
+
+
+class OnlyFieldsTestCase(TestCase):
+    def setUp(self):
+        test = TestModel.objects.create(field1='value')
+        TestRelatedModel.objects.create(test=test, name='name')
+
+    def test_unused_columns_are_not_fetched(self):
+        class RelatedDataset(ModelDataset):
+            class Meta:
+                model = TestRelatedModel
+                fields = ['test']
+
+        with CaptureQueriesContext(connection) as queries:
+            data = RelatedDataset()
+
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"name"', queries[0]['sql'])
+        self.assertIn('"field1"', queries[0]['sql'])
+        self.assertEqual(data['test'], ['TestModel object'])
+
+    def test_related_path_restricts_related_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = SimpleDataset(TestRelatedModel.objects.all(),
+                                 headers={'value': 'test__field1'})
+
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"name"', queries[0]['sql'])
+        self.assertEqual(data['value'], ['value'])
+
+    def test_callables_fetch_every_column(self):
+        with CaptureQueriesContext(connection) as queries:
+            SimpleDataset(TestRelatedModel.objects.all(),
+                          headers={'name': lambda obj: obj.name.upper()})
+
+        self.assertIn('"name"', queries[0]['sql'])
+
+
+class ImportDataTestCase(TestCase):
+    def setUp(self):
+        TestTypedModel.objects.create(status='d', flag=True, amount=3,
+                                      created=datetime.date(2017, 4, 3))
+        TestTypedModel.objects.create(status='n', flag=False)
+
+        class TypedDataset(ModelDataset):
+            class Meta:
+                model = TestTypedModel
+
+        self.dataset_class = TypedDataset
+
+    def values(self):
+        return list(TestTypedModel.objects.order_by('pk').values_list(
+            'pk', 'status', 'flag', 'created', 'amount'))
+
+    def test_import_round_trips_an_export(self):
+        before = self.values()
+        exported = self.dataset_class().csv
+        TestTypedModel.objects.all().delete()
+
+        with self.assertNumQueries(4):
+            created, updated = self.dataset_class.import_data(exported,
+                                                              format='csv')
+
+        self.assertEqual((created, updated), (2, 0))
+        self.assertEqual(self.values(), before)
+
+    def test_import_updates_existing_objects(self):
+        exported = self.dataset_class().json
+        TestTypedModel.objects.update(status='n', amount=None)
+
+        created, updated = self.dataset_class.import_data(exported)
+
+        self.assertEqual((created, updated), (0, 2))
+        self.assertEqual(self.values()[0][1], 'd')
+        self.assertEqual(self.values()[0][4], 3)
+
+    def test_foreign_keys_round_trip_through_their_attname(self):
+        test = TestModel.objects.create(field1='value')
+        TestRelatedModel.objects.create(test=test, name='related')
+
+        class RelatedByPkDataset(ModelDataset):
+            test_id = Field(header='test')
+
+            class Meta:
+                model = TestRelatedModel
+                exclude = ['test']
+
+        exported = RelatedByPkDataset().csv
+        TestRelatedModel.objects.all().delete()
+
+        created, updated = RelatedByPkDataset.import_data(exported,
+                                                          format='csv')
+
+        self.assertEqual((created, updated), (1, 0))
+        self.assertEqual(list(TestRelatedModel.objects.values_list(
+            'test', 'name')), [(test.pk, 'related')])
+
+    def test_foreign_keys_exported_by_name_are_ignored(self):
+        test = TestModel.objects.create(field1='value')
+        related = TestRelatedModel.objects.create(test=test, name='related')
+
+        class RelatedDataset(ModelDataset):
+            class Meta:
+                model = TestRelatedModel
+
+        exported = RelatedDataset().csv
+        related.name = 'changed'
+        related.save()
+
+        created, updated = RelatedDataset.import_data(exported, format='csv')
+
+        self.assertEqual((created, updated), (0, 1))
+        related.refresh_from_db()
+        self.assertEqual((related.test, related.name), (test, 'related'))
+
+
+class ValuesListDatasetTestCase(TestCase):
+    def setUp(self):
+        TestTypedModel.objects.create(status='d', flag=True, amount=3)
+
+    def test_plain_columns_use_values_list(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = SimpleDataset(TestTypedModel.objects.all(),
+                                 headers=['status', 'flag', 'amount'])
+
+        self.assertEqual(list(data[0]), ['Done', 'Y', '3'])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"id"', queries[0]['sql'])
+
+    def test_callable_attribute_uses_model_instances(self):
+        data = SimpleDataset(TestTypedModel.objects.all(), headers={
+            'status': 'status',
+            'double': lambda obj: obj.amount * 2,
+        })
+
+        self.assertEqual(data['status'], ['Done'])
+        self.assertEqual(data['double'], ['6'])
+
+
+class CompiledColumnsTestCase(TestCase):
+    headers = ['id', 'status', 'flag', 'created', 'amount']
+
+    def setUp(self):
+        TestTypedModel.objects.create(status='n', flag=False,
+                                      created=datetime.date(2017, 4, 3))
+        TestTypedModel.objects.create(status='d', flag=True, amount=0)
+
+    def assertMatchesGetattrs(self, data):
+        objects = TestTypedModel.objects.order_by('pk')
+        self.assertEqual([list(row) for row in data],
+                         [data._getattrs(obj) for obj in objects])
+
+    def test_values_list_rows_match_getattrs(self):
+        data = SimpleDataset(TestTypedModel.objects.order_by('pk'),
+                             headers=self.headers)
+
+        self.assertMatchesGetattrs(data)
+
+    def test_model_instance_rows_match_getattrs(self):
+        data = SimpleDataset(TestTypedModel.objects.order_by('pk'),
+                             headers=self.headers + ['pk'])
+
+        self.assertMatchesGetattrs(data)
+
+    def test_customised_cleanval_is_used(self):
+        class UpperDataset(SimpleDataset):
+            def _cleanval(self, value, attr):
+                value = super(UpperDataset, self)._cleanval(value, attr)
+                return value.upper()
+
+        data = UpperDataset(TestTypedModel.objects.order_by('pk'),
+                            headers=['status'])
+
+        self.assertEqual(data['status'], ['NEW', 'DONE'])
+
+
+class RawDatasetTestCase(TestCase):
+    def setUp(self):
+        TestTypedModel.objects.create(status='d', flag=True, amount=3,
+                                      created=datetime.date(2016, 1, 31))
+        TestTypedModel.objects.create(status='n')
+
+        class TypedDataset(ModelDataset):
+            class Meta:
+                model = TestTypedModel
+                fields = ['status', 'flag', 'created', 'amount']
+        self.dataset_class = TypedDataset
+
+    def test_raw_values_keep_their_type(self):
+        data = self.dataset_class(raw=True)
+
+        self.assertEqual(data[0][data.headers.index('flag')], True)
+        self.assertEqual(data[0][data.headers.index('amount')], 3)
+        self.assertEqual(data[0][data.headers.index('created')],
+                         datetime.date(2016, 1, 31))
+        self.assertEqual(data[1][data.headers.index('created')], None)
+        self.assertEqual(data[0][data.headers.index('status')], 'Done')
+
+    def test_text_formats_match_cleaned_datasets(self):
+        raw = self.dataset_class(raw=True)
+
+        self.assertEqual(raw.export('csv'), self.dataset_class().csv)
+
+    def test_format_properties_format_raw_values(self):
+        class RawDataset(self.dataset_class):
+            class Meta:
+                model = TestTypedModel
+                fields = ['status', 'flag', 'created', 'amount']
+                raw = True
+
+        self.assertEqual(RawDataset().csv, self.dataset_class().csv)
+        self.assertEqual(RawDataset().get_csv(), self.dataset_class().csv)
+
+    def test_json_gets_native_types(self):
+        class RawDataset(self.dataset_class):
+            class Meta:
+                model = TestTypedModel
+                fields = ['flag', 'amount']
+                raw = True
+
+        self.assertEqual(sorted(json.loads(RawDataset().export('json'))[0]
+                                .items()),
+                         [('amount', 3), ('flag', True)])
+
+
+class ColumnwiseDatasetTestCase(TestCase):
+    def setUp(self):
+        test = TestModel.objects.create(field1='value')
+        for i in range(5):
+            TestMixedModel.objects.create(
+                test=test, name='None' if i == 2 else 'name {0}'.format(i),
+                status='nps'[i % 3], flag=i % 2 == 0,
+                created=datetime.date(2016, 1, 1 + i % 2),
+                amount=decimal.Decimal(i) / 4)
+        TestTypedModel.objects.create(status='d', flag=True, amount=3)
+        TestTypedModel.objects.create(status='n')
+
+    def test_rows_match_row_wise_build(self):
+        for model in (TestMixedModel, TestTypedModel):
+            # batches smaller than the table
+            data = SimpleDataset(model.objects.all(), chunk_size=2,
+                                 columnwise=True)
+            self.assertEqual(data.csv, SimpleDataset(model.objects.all()).csv)
+
+    def test_meta_option(self):
+        class MixedDataset(ModelDataset):
+            class Meta:
+                model = TestMixedModel
+                columnwise = True
+
+        class RowWiseDataset(ModelDataset):
+            class Meta:
+                model = TestMixedModel
+
+        self.assertEqual(MixedDataset().csv, RowWiseDataset().csv)
+
+
+class ExportViewTestCase(TestCase):
+    def setUp(self):
+        TestModel.objects.create(field1='value')
+        TestModel.objects.create(field1='caf\xe9, "quoted"')
+        self.request = RequestFactory().get('/export/')
+
+    def test_streaming_csv_matches_buffered_csv(self):
+        buffered = export(self.request, model=TestModel, file_type='csv')
+        streamed = export(self.request, model=TestModel, file_type='csv',
+                          stream=True)
+
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(b''.join(streamed.streaming_content),
+                         buffered.content)
+
+    @unittest.skipIf(streaming.Workbook is None, "openpyxl isn't installed")
+    def test_streaming_xlsx(self):
+        from openpyxl import load_workbook
+
+        response = export(self.request, model=TestModel, file_type='xlsx',
+                          stream=True)
+        workbook = load_workbook(io.BytesIO(
+            b''.join(response.streaming_content)))
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            [[cell.value for cell in row] for row in workbook.active.rows],
+            [['id', 'field1']] + [
+                list(row) for row in SimpleDataset(TestModel.objects.all())])
+
+    def test_stream_falls_back_for_unsupported_formats(self):
+        response = export(self.request, model=TestModel, file_type='json',
+                          stream=True)
+
+        self.assertFalse(response.streaming)
+
+
+@unittest.skipIf(columnar.pyarrow is None, "pyarrow isn't installed")
+class ColumnarExportTestCase(TestCase):
+    def setUp(self):
+        TestTypedModel.objects.create(status='d', flag=True, amount=3,
+                                      created=datetime.date(2016, 1, 31))
+        TestTypedModel.objects.create(status='n')
+        self.request = RequestFactory().get('/export/')
+
+    def read(self, response):
+        return io.BytesIO(b''.join(response.streaming_content))
+
+    def test_parquet_columns_are_typed(self):
+        import pyarrow.parquet
+
+        response = export(self.request, model=TestTypedModel,
+                          file_type='parquet', chunk_size=1)
+        parquet = pyarrow.parquet.ParquetFile(self.read(response))
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(parquet.num_row_groups, 2)
+        self.assertEqual(parquet.read().to_pydict(), {
+            'id': list(TestTypedModel.objects.values_list('pk', flat=True)),
+            'status': ['Done', 'New'],
+            'flag': [True, False],
+            'created': [datetime.date(2016, 1, 31), None],
+            'amount': [3, None],
+        })
+
+    def test_arrow_file(self):
+        import pyarrow
+
+        response = export(self.request, model=TestTypedModel,
+                          headers={'Amount': 'amount'}, file_type='arrow')
+        table = pyarrow.ipc.open_file(self.read(response)).read_all()
+
+        self.assertEqual(table.schema.field('Amount').type, pyarrow.int64())
+        self.assertEqual(table.column('Amount').to_pylist(), [3, None])
+
+
+@override_settings(
+    TABLIB_MODELS={'tablib_test.testmodel': {}},
+    TABLIB_MODEL_OPTIONS={'tablib_test.testmodel': {
+        'FILE_TYPE': 'csv', 'SERVER_SIDE_CURSOR': True, 'FETCH_SIZE': 2}})
+class GenericExportTestCase(TestCase):
+    def setUp(self):
+        for i in range(5):
+            TestModel.objects.create(field1='value {0}'.format(i))
+        self.request = RequestFactory().get('/export/')
+
+    def test_model_options(self):
+        response = generic_export(self.request, 'tablib_test.testmodel')
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8'),
+                         SimpleDataset(TestModel.objects.all()).csv)
+
+    def test_server_side_cursor_falls_back_on_other_databases(self):
+        self.assertIsNone(iterate_server_side(TestModel.objects.all()))
+        # fetched in chunks of FETCH_SIZE instead
+        with CaptureQueriesContext(connection) as queries:
+            b''.join(generic_export(self.request, 'tablib_test.testmodel'))
+        self.assertEqual(len(queries), 3)
+
+
+class FetchSizeConnection(sqlite3.Connection):
+    """
+    A SQLite connection that takes cursor names like psycopg2 and records the
+    number of rows asked for by each ``fetchmany()``.
+    """
+    fetch_sizes = []
+
+    def cursor(self, factory=sqlite3.Cursor, name=None):
+        fetch_sizes = self.fetch_sizes
+
+        class Cursor(factory):
+            def fetchmany(self, size):
+                fetch_sizes.append(size)
+                return factory.fetchmany(self, size)
+
+        return sqlite3.Connection.cursor(self, Cursor)
+
+
+class PostgreSQLDatabaseWrapper(DatabaseWrapper):
+    vendor = 'postgresql'
+
+
+class ServerSideCursorTestCase(TestCase):
+    def setUp(self):
+        FetchSizeConnection.fetch_sizes = []
+        connections['server_side'] = PostgreSQLDatabaseWrapper(
+            dict(connection.settings_dict,
+                 OPTIONS={'factory': FetchSizeConnection}),
+            alias='server_side')
+
+    def tearDown(self):
+        connections['server_side'].close()
+        del connections['server_side']
+
+    def test_fetch_size(self):
+        rows = iterate_values(TestModel.objects.using('server_side'),
+                              ['field1'], chunk_size=500, server_side=True)
+
+        self.assertEqual(list(rows), [])
+        self.assertEqual(FetchSizeConnection.fetch_sizes, [500])
+
+
+class ExportStatsTestCase(TestCase):
+    def setUp(self):
+        for i in range(3):
+            TestModel.objects.create(field1='value {0}'.format(i))
+        self.request = RequestFactory().get('/export/')
+        self.stats = []
+        export_finished.connect(self.receiver, sender=TestModel)
+        self.addCleanup(export_finished.disconnect, self.receiver,
+                        sender=TestModel)
+
+    def receiver(self, sender, stats, request, **kwargs):
+        self.stats.append(stats)
+
+    def test_buffered_export_stats(self):
+        response = export(self.request, model=TestModel, file_type='csv',
+                          cache=False)
+
+        stats, = self.stats
+        self.assertEqual(list(stats.timings), ['queryset', 'fetch', 'rows',
+                                               'serialize'])
+        self.assertEqual((stats.rows, stats.queries, stats.bytes),
+                         (3, 1, len(response.content)))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_streamed_export_stats(self):
+        response = export(self.request, model=TestModel, file_type='csv',
+                          stream=True, chunk_size=2)
+        self.assertEqual(self.stats, [])
+        content = b''.join(response.streaming_content)
+
+        stats, = self.stats
+        self.assertEqual((stats.rows, stats.queries, stats.bytes),
+                         (3, 2, len(content)))
+        self.assertGreater(stats.timings['serialize'], 0)
+
+    def test_queries_are_counted_without_logging_them(self):
+        logged = len(connection.queries_log)
+        export(self.request, model=TestModel, file_type='csv', cache=False)
+
+        self.assertEqual(self.stats[0].queries, 1)
+        self.assertEqual(len(connection.queries_log), logged)
+        self.assertNotCounting()
+
+    def assertNotCounting(self):
+        # the connection itself rather than its django.db.connection proxy
+        wrapper = connections['default']
+        self.assertNotIn('make_cursor', wrapper.__dict__)
+        self.assertEqual(getattr(wrapper, 'execute_wrappers', []), [])
+
+    def test_unknown_formats_are_not_counted(self):
+        with self.assertRaises(Http404):
+            export(self.request, model=TestModel, file_type='unknown')
+        self.assertNotCounting()
+
+    def test_closed_streams_stop_counting(self):
+        # the version is read before the response is returned
+        response = export(self.request, model=TestModel, file_type='csv',
+                          stream=True, version_field='id')
+        # closed before its content is read; like the test client, keep the
+        # test's database connection open
+        request_finished.disconnect(close_old_connections)
+        try:
+            response.close()
+        finally:
+            request_finished.connect(close_old_connections)
+
+        stats, = self.stats
+        self.assertEqual((stats.queries, stats.bytes), (1, 0))
+        self.assertNotCounting()
+
+    @override_settings(TABLIB_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = export(self.request, model=TestModel, file_type='json',
+                          cache=False)
+
+        self.assertRegexpMatches(
+            response['Server-Timing'],
+            r'^tablib-queryset;dur=[\d.]+, tablib-fetch;dur=[\d.]+, '
+            r'tablib-rows;dur=[\d.]+, tablib-serialize;dur=[\d.]+$')
+
+
+@override_settings(
+    TABLIB_MODELS={'tablib_test.testmodel': {}},
+    TABLIB_MODEL_OPTIONS={'tablib_test.testmodel': {
+        'FILE_TYPE': 'json', 'WATERMARK': 'id'}})
+class IncrementalExportTestCase(TestCase):
+    def setUp(self):
+        self.objects = [TestModel.objects.create(field1='value {0}'.format(i))
+                        for i in range(3)]
+
+    def get(self, **params):
+        return generic_export(RequestFactory().get('/export/', params),
+                              'tablib_test.testmodel')
+
+    def exported(self, response):
+        return [int(row['id'])
+                for row in json.loads(response.content.decode())]
+
+    def test_only_rows_changed_since_the_watermark_are_exported(self):
+        response = self.get()
+        self.assertEqual(self.exported(response),
+                         [obj.pk for obj in self.objects])
+
+        new = TestModel.objects.create(field1='new')
+        response = self.get(since=response['X-Tablib-Watermark'])
+        self.assertEqual(self.exported(response), [new.pk])
+
+        response = self.get(since=response['X-Tablib-Watermark'])
+        self.assertEqual(self.exported(response), [])
+
+    def test_invalid_token(self):
+        self.assertEqual(self.get(since='{0}'.format(self.objects[0].pk))
+                         .status_code, 400)
+
+    def test_model_dataset_since(self):
+        class TestModelDataset(ModelDataset):
+            class Meta:
+                model = TestModel
+                watermark = 'id'
+
+        data = TestModelDataset(since=self.objects[0].pk)
+
+        self.assertEqual(data.watermark, self.objects[-1].pk)
+        self.assertEqual(len(data), 2)
+
+
+class ConditionalExportTestCase(TestCase):
+    def setUp(self):
+        self.test = TestModel.objects.create(field1='value')
+
+    def get(self, **headers):
+        request = RequestFactory().get('/export/', **headers)
+        return export(request, model=TestModel, file_type='csv',
+                      version_field='id')
+
+    def test_unchanged_export_is_not_modified(self):
+        etag = self.get()['ETag']
+        with self.assertNumQueries(1):
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_changes_are_noticed(self):
+        etag = self.get()['ETag']
+        TestModel.objects.create(field1='new')
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.get()['ETag']
+        self.test.delete()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_format_changes_the_etag(self):
+        request = RequestFactory().get('/export/')
+        self.assertNotEqual(
+            self.get()['ETag'],
+            export(request, model=TestModel, file_type='json',
+                   version_field='id')['ETag'])
+
+
+class TablibAdminTestCase(TestCase):
+    @unittest.skipIf(streaming.Workbook is None, "openpyxl isn't installed")
+    def test_xlsx_exports_are_streamed(self):
+        TestModel.objects.create(field1='value')
+        model_admin = admin.site._registry[TestModel]
+        request = RequestFactory().post('/admin/')
+
+        response = actions.xlsx_export_action(model_admin, request,
+                                              TestModel.objects.all())
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="test models.xlsx"')
+
+    def test_export_queryset_skips_change_list_counts(self):
+        objects = [TestModel.objects.create(field1='value {0}'.format(i))
+                   for i in range(3)]
+        model_admin = admin.site._registry[TestModel]
+        request = RequestFactory().get('/admin/', {'field1': 'value 1'})
+        with self.assertNumQueries(0):
+            queryset = model_admin.get_tablib_queryset(request)
+
+        self.assertEqual(list(queryset), [objects[1]])
+
+    def test_columnar_formats_need_pyarrow(self):
+        class ColumnarAdmin(TablibAdmin):
+            formats = ['csv', 'parquet', 'arrow']
+
+        if columnar.pyarrow is None:
+            with self.assertRaises(ValueError):
+                ColumnarAdmin(TestModel, admin.site)
+        else:
+            ColumnarAdmin(TestModel, admin.site)
+
+
+class ExportActionTestCase(TestCase):
+    def setUp(self):
+        self.objects = [TestModel.objects.create(field1='value {0}'.format(i))
+                        for i in range(3)]
+        self.model_admin = admin.site._registry[TestModel]
+        self.request = RequestFactory().post('/admin/')
+
+    def test_action_uses_admin_export_settings(self):
+        self.model_admin.headers = {'Field': 'field1'}
+        self.model_admin.export_encoding = 'latin-1'
+        self.model_admin.export_stream = True
+        self.addCleanup(delattr, self.model_admin, 'headers')
+        self.addCleanup(delattr, self.model_admin, 'export_encoding')
+        self.addCleanup(delattr, self.model_admin, 'export_stream')
+
+        queryset = TestModel.objects.filter(pk__in=[self.objects[1].pk])
+        response = actions.csv_export_action(self.model_admin, self.request,
+                                             queryset)
+
+        self.assertEqual(response['Content-Type'],
+                         'text/csv; charset=latin-1')
+        self.assertEqual(b''.join(response.streaming_content),
+                         b'Field\r\nvalue 1\r\n')
+
+
+class CompressedExportTestCase(TestCase):
+    def setUp(self):
+        for i in range(100):
+            TestModel.objects.create(field1='value {0}'.format(i))
+        self.request = RequestFactory().get(
+            '/export/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.csv = export(self.request, model=TestModel,
+                          file_type='csv').content
+
+    def compressed(self, compression, request=None, **kwargs):
+        response = export(request or self.request, model=TestModel,
+                          file_type='csv', compression=compression, **kwargs)
+        return response, b''.join(response.streaming_content)
+
+    def test_gzip(self):
+        for stream in (False, True):
+            response, content = self.compressed('gzip', stream=stream)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(
+                zlib.decompress(content, 16 + zlib.MAX_WBITS), self.csv)
+
+    def test_gzip_file(self):
+        # the client doesn't accept the gzip content encoding
+        response, content = self.compressed(
+            'gzip', request=RequestFactory().get('/export/'))
+
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="export.csv.gz"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(
+            zlib.decompress(content, 16 + zlib.MAX_WBITS), self.csv)
+
+    def test_etags(self):
+        etags = [
+            export(request, model=TestModel, file_type='csv',
+                   compression=compression, version_field='id')['ETag']
+            for compression, request in [
+                (None, self.request), ('gzip', self.request),
+                ('gzip', RequestFactory().get('/export/')),
+                ('zip', self.request)]]
+
+        self.assertEqual(len(set(etags)), 4)
+
+    def test_zip(self):
+        response, content = self.compressed('zip', stream=True)
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="export.csv.zip"')
+        archive = zipfile.ZipFile(io.BytesIO(content))
+        self.assertEqual(archive.read('export.csv'), self.csv)
+
+    def test_unknown_compression(self):
+        request = RequestFactory().get('/export/', {'compression': 'rar'})
+        with override_settings(TABLIB_MODELS={'tablib_test.testmodel': {}}):
+            response = generic_export(request, 'tablib_test.testmodel')
+        self.assertEqual(response.status_code, 400)
+
+
+def read_async_response(response):
+    # consumed through async_to_sync, the way WSGI servers do
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return b''.join(response)
+
+
+@unittest.skipIf(django.VERSION < (4, 2), "async views need Django 4.2")
+class AsyncExportTestCase(TestCase):
+    def setUp(self):
+        for i in range(5):
+            TestModel.objects.create(field1='value {0}'.format(i))
+        self.request = RequestFactory().get('/export/')
+
+    def export(self, request=None, **kwargs):
+        kwargs.setdefault('model', TestModel)
+        kwargs.setdefault('file_type', 'csv')
+        return async_to_sync(async_views.export)(request or self.request,
+                                                 **kwargs)
+
+    def test_csv_matches_sync_export(self):
+        response = self.export(chunk_size=2)
+
+        self.assertTrue(response.is_async)
+        self.assertEqual(
+            read_async_response(response),
+            export(self.request, model=TestModel, file_type='csv').content)
+
+    def test_other_formats_are_built_by_the_sync_view(self):
+        response = self.export(file_type='json')
+
+        self.assertFalse(response.streaming)
+        self.assertEqual(json.loads(response.content.decode()), json.loads(
+            SimpleDataset(TestModel.objects.all()).json))
+
+    def test_unchanged_export_is_not_modified(self):
+        etag = self.export(version_field='id')['ETag']
+        request = RequestFactory().get('/export/', HTTP_IF_NONE_MATCH=etag)
+
+        response = self.export(request, version_field='id')
+
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(TABLIB_MODELS={'tablib_test.testmodel': {}})
+    def test_generic_export_rejects_bad_filters(self):
+        request = RequestFactory().get('/export/', {'field1': 'value 1'})
+
+        response = async_to_sync(async_views.generic_export)(
+            request, 'tablib_test.testmodel')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_streams_csv(self):
+        class AsyncTestModelAdmin(async_views.AsyncTablibAdmin):
+            formats = ['csv']
+            headers = ['field1']
+
+        model_admin = AsyncTestModelAdmin(TestModel, admin.site)
+        request = RequestFactory().get('/admin/', {'field1': 'value 1'})
+        request.user = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+
+        response = model_admin.tablib_export(request, 'csv')
+
+        self.assertTrue(response.is_async)
+        self.assertEqual(read_async_response(response),
+                         b'field1\r\nvalue 1\r\n')
+
+
+class RelatedInline(admin.TabularInline):
+    model = TestRelatedModel
+    headers = {'Name': 'name'}
+
+
+class RelatedDataset(ModelDataset):
+    class Meta:
+        model = TestRelatedModel
+        fields = ['name']
+
+
+class DatabookTestCase(TestCase):
+    def setUp(self):
+        self.tests = [TestModel.objects.create(field1='value {0}'.format(i))
+                      for i in range(2)]
+        for test in self.tests:
+            TestRelatedModel.objects.create(
+                test=test, name='{0} name'.format(test.field1))
+
+    def test_one_sheet_per_dataset(self):
+        class TestDataset(ModelDataset):
+            class Meta:
+                model = TestModel
+                fields = ['field1']
+
+        book = ModelDatabook([TestDataset, RelatedDataset])
+        sheets = json.loads(book.json)
+
+        self.assertEqual([sheet['title'] for sheet in sheets],
+                         ['test models', 'test related models'])
+        self.assertEqual(sheets[0]['data'],
+                         [{'field1': 'value 0'}, {'field1': 'value 1'}])
+
+    def test_admin_exports_inlines_as_sheets(self):
+        model_admin = admin.site._registry[TestModel]
+        model_admin.export_inlines = True
+        model_admin.inlines = [RelatedInline]
+        model_admin.formats = ['csv', 'xls', 'json']
+        self.addCleanup(delattr, model_admin, 'export_inlines')
+        self.addCleanup(delattr, model_admin, 'inlines')
+        self.addCleanup(delattr, model_admin, 'formats')
+        request = RequestFactory().get('/admin/', {'field1': 'value 1'})
+        request.user = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+
+        response = model_admin.tablib_export(request, 'json')
+        sheets = json.loads(response.content.decode())
+
+        self.assertEqual(sheets[1]['title'], 'test related models')
+        self.assertEqual(sheets[1]['data'], [{'Name': 'value 1 name'}])
+
+
+class ConcurrentDatabookTestCase(TransactionTestCase):
+    def test_sheets_are_built_concurrently(self):
+        test = TestModel.objects.create(field1='value')
+        TestRelatedModel.objects.create(test=test, name='name')
+        TestTypedModel.objects.create(status='d', amount=3)
+
+        class TypedDataset(ModelDataset):
+            class Meta:
+                model = TestTypedModel
+                fields = ['status', 'amount']
+
+        book = ModelDatabook(
+            [TypedDataset, RelatedDataset,
+             partial(SimpleDataset, TestModel.objects.all(), ['field1'])],
+            workers=3)
+
+        self.assertEqual(
+            [(sheet.title, sheet[:]) for sheet in book.sheets()],
+            [('test typed models', [('Done', '3')]),
+             ('test related models', [('name',)]),
+             ('test models', [('value',)])])
+
+
+def upper_field1(obj):
+    return obj.field1.upper()
+
+
+@override_settings(
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    TABLIB_EXPORT_CACHE={})
+class ExportCacheTestCase(TestCase):
+    def setUp(self):
+        self.test = TestModel.objects.create(field1='value')
+        self.request = RequestFactory().get('/export/')
+
+    def test_repeated_export_is_served_from_cache(self):
+        first = export(self.request, model=TestModel, file_type='csv')
+        with self.assertNumQueries(0):
+            second = export(self.request, model=TestModel, file_type='csv')
+
+        self.assertEqual(first.content, second.content)
+
+    def test_saving_a_model_invalidates_its_exports(self):
+        export(self.request, model=TestModel, file_type='csv')
+        self.test.field1 = 'changed'
+        self.test.save()
+
+        response = export(self.request, model=TestModel, file_type='csv')
+        self.assertIn(b'changed', response.content)
+
+    def get_cache_key(self, headers=None):
+        return get_cache_key(caches['default'], TestModel.objects.all(),
+                             headers, 'csv', 'utf-8')
+
+    def test_languages_are_cached_separately(self):
+        with translation.override('en'):
+            english = self.get_cache_key()
+        with translation.override('fr'):
+            french = self.get_cache_key()
+
+        self.assertNotEqual(english, french)
+
+    def test_callable_headers_keys_are_stable(self):
+        # the same function in another process lives at another address
+        copy = types.FunctionType(upper_field1.__code__,
+                                  upper_field1.__globals__,
+                                  upper_field1.__name__)
+
+        self.assertEqual(self.get_cache_key({'Field': upper_field1}),
+                         self.get_cache_key({'Field': copy}))
+
+
+@override_settings(
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    TABLIB_EXPORT_CACHE={})
+class ImportCacheTestCase(TransactionTestCase):
+    # imports invalidate cached exports when their transaction commits,
+    # which never happens in a TestCase
+    def test_imports_invalidate_cached_exports(self):
+        TestModel.objects.create(field1='value')
+
+        class TestDataset(ModelDataset):
+            class Meta:
+                model = TestModel
+
+        request = RequestFactory().get('/export/')
+        exported = export(request, model=TestModel, file_type='csv').content
+        TestDataset.import_data(
+            exported.decode('utf-8').replace('value', 'imported'),
+            format='csv')
+
+        response = export(request, model=TestModel, file_type='csv')
+        self.assertIn(b'imported', response.content)
+
+
+class ParallelExportTestCase(TestCase):
+    def setUp(self):
+        for i in range(10):
+            TestModel.objects.create(field1='value {0}'.format(i))
+
+    def test_pk_ranges_cover_every_object(self):
+        ranges = get_pk_ranges(TestModel.objects.all(), 3)
+
+        self.assertEqual(len(ranges), 3)
+        self.assertEqual(sum(
+            TestModel.objects.filter(pk__gte=start, pk__lt=stop).count()
+            for start, stop in ranges), 10)
+
+    def test_exports_in_a_transaction_run_serially(self):
+        # TestCase wraps every test in a transaction, which worker processes
+        # couldn't see.
+        data = parallel_export(TestModel.objects.all(), file_type='json',
+                               workers=2)
+
+        self.assertEqual(data, SimpleDataset(TestModel.objects.all()).json)
+
+
+class ParallelShardsTestCase(TransactionTestCase):
+    # the test database is on disk (see settings), so that worker processes
+    # can read the rows committed by the test
+    def setUp(self):
+        for i in range(10):
+            TestModel.objects.create(field1='value {0}'.format(i))
+
+    def test_shards_are_merged_in_order(self):
+        queryset = TestModel.objects.order_by('pk')
+        dataset = SimpleDataset(queryset)
+        for file_type in ('csv', 'json', 'xls'):
+            data = parallel_export(queryset, file_type=file_type, workers=2,
+                                   shards=3)
+            if file_type == 'csv':
+                # shards are encoded as they are exported
+                self.assertEqual(data, dataset.csv.encode('utf-8'))
+            elif file_type == 'json':
+                self.assertEqual(json.loads(data), json.loads(dataset.json))
+            else:
+                self.assertEqual(data, dataset.xls)
+
+
+class ExportJobTestCase(TestCase):
+    def setUp(self):
+        TestModel.objects.create(field1='value')
+        export_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_root)
+        overrides = override_settings(
+            TABLIB_EXPORT_ROOT=export_root,
+            TABLIB_EXPORT_BACKEND='django_tablib.jobs.SynchronousBackend')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_job_writes_export_to_storage(self):
+        job_id = jobs.start_export_job(TestModel.objects.all(),
+                                       file_type='csv')
+        status = jobs.get_job_status(job_id)
+
+        self.assertEqual(status['status'], jobs.DONE)
+        self.assertEqual(status['rows'], 1)
+        self.assertEqual(status['database'], 'default')
+        with jobs.get_export_storage().open(status['file']) as f:
+            content = f.read()
+        request = RequestFactory().get('/export/')
+        self.assertEqual(
+            content, export(request, model=TestModel, file_type='csv').content)
+
+    def test_expired_jobs_are_purged(self):
+        old_job = jobs.start_export_job(TestModel.objects.all())
+        status_path = jobs.get_export_storage().path(
+            '{0}/status.json'.format(jobs._job_dir(old_job)))
+        updated = os.path.getmtime(status_path) - jobs.DEFAULT_EXPIRY - 1
+        os.utime(status_path, (updated, updated))
+
+        new_job = jobs.start_export_job(TestModel.objects.all())
+
+        self.assertIsNone(jobs.get_job_status(old_job))
+        self.assertEqual(jobs.get_job_status(new_job)['status'], jobs.DONE)
+
+    @override_settings(TABLIB_EXPORT_ROOT=None)
+    def test_exports_are_not_written_to_media_root(self):
+        root = jobs.get_export_root()
+
+        self.assertTrue(root.startswith(tempfile.gettempdir()))
+        self.assertNotEqual(root, settings.MEDIA_ROOT)
+
+    def test_admin_export_runs_in_background(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        model_admin = admin.site._registry[TestModel]
+        model_admin.export_async = True
+        self.addCleanup(delattr, model_admin, 'export_async')
+
+        response = self.client.get(reverse(
+            'admin:tablib_test_testmodel_tablib_export',
+            kwargs={'export_format': 'xls'}))
+        self.assertEqual(response.status_code, 302)
+
+        job_url = response['Location']
+        self.assertEqual(self.client.get(job_url).status_code, 200)
+        status = self.client.get(job_url, {'status': ''}).json()
+        self.assertEqual(status['status'], jobs.DONE)
+
+        download = self.client.get(job_url + 'download/')
+        self.assertEqual(download['Content-Type'],
+                         'application/vnd.ms-excel; charset=utf-8')